@@ -0,0 +1,45 @@
+import logging
+import os
+import time
+
+from common import dashboard_data, metrics
+from common.company_matcher import load_blacklist
+from common.warehouse import company_term_counts, get_warehouse, salary_summary, term_counts
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+    encoding="utf-8",
+)
+
+warehouse = get_warehouse()
+blacklist_cache = os.getenv("BLACKLIST_CACHE", "state/blacklist.json")
+
+
+def run():
+    """Rebuild the dashboard's aggregate tables from extracted_data.jobs.
+
+    The jobs are prepared the way the app used to prepare them on every page
+    load (blacklist, replacements, one count per job and term), and counted
+    per keyword, per keyword and company, and summarized by salary.
+    """
+    start_time = time.time()
+    blacklist = load_blacklist(warehouse.blacklist_companies, blacklist_cache)
+    data, excluded = dashboard_data.prepare_jobs(warehouse.dashboard_jobs(), blacklist)
+    logging.info(f"Aggregating {len(data)} jobs, {excluded} from blacklisted companies excluded")
+
+    for name, df in [
+        (term_counts, dashboard_data.term_counts(data)),
+        (company_term_counts, dashboard_data.company_term_counts(data)),
+        (salary_summary, dashboard_data.salary_summary(data)),
+    ]:
+        warehouse.overwrite(name, df)
+        logging.info(f"Saved {len(df)} rows to {name}")
+
+    logging.info(f"Dashboard aggregates rebuilt - elapsed: {time.time() - start_time:.2f}")
+
+
+if __name__ == "__main__":
+    metrics.start_exporter()
+    run()
@@ -1,12 +1,10 @@
-import pandas as pd
-import json
 import streamlit as st
-from collections import Counter
 import altair as alt
-import numpy as np
+import os
 
-from google.oauth2 import service_account
-import pandas_gbq
+from common.company_matcher import load_blacklist
+from common.warehouse import get_warehouse
+from common.dashboard_data import all_keywords, prepare_jobs, top_terms
 
 
 # Set page configuration
@@ -35,230 +33,63 @@ with st.expander("Introduction"):
 
 with st.container():
 
+    # The charts come from small aggregate tables the pipeline rebuilds after
+    # extraction, so a page load does not depend on how many jobs there are
     @st.cache_data(ttl=3600)  # Cache data for 1 hour
-    def load_data():
-        sql = """
-        SELECT FORMAT_TIMESTAMP('%Y-%m-%d %H:%M:%S', 
-            TIMESTAMP_MILLIS(CAST(created_on * 1000 AS INT64)), 
-            "America/New_York") AS time_extracted,
-        keyword, company, title, summary, url, 
-        hard_skills, tech_stack, soft_skills, 
-        industries, benefits, salary
-        FROM `extracted_data.jobs` 
-        ORDER BY created_on
-        """
-
-        credentials = service_account.Credentials.from_service_account_file(
-            "keys/gbq.json",
-        )
+    def load_term_counts():
+        return get_warehouse().dashboard_term_counts()
 
-        project_id = "techlistme"
+    @st.cache_data(ttl=3600)
+    def load_salaries():
+        return get_warehouse().dashboard_salaries()
 
-        # Load data from BigQuery
-        data = pandas_gbq.read_gbq(
-            sql,
-            project_id=project_id,
-            credentials=credentials,
-            use_bqstorage_api=True,
-        )
-        return data
+    @st.cache_data(ttl=3600)
+    def load_company_term_counts(keyword, company):
+        return get_warehouse().dashboard_company_term_counts(keyword, company)
 
-    data = load_data()
-    data = data.dropna(subset=["summary"])
+    # Only the newest jobs are listed in the data table
+    table_rows = 1000
 
-    def convert_strings_to_lists(df, column_name):
-        df[column_name] = df[column_name].apply(
-            lambda x: list(set(x.split(","))) if pd.notna(x) else []
-        )
-        return df
-
-    columns_with_lists = [
-        "tech_stack",
-        "soft_skills",
-        "hard_skills",
-        "industries",
-        "benefits",
-    ]
-    # Convert column
-    for column in columns_with_lists:
-        data = convert_strings_to_lists(data, column)
-
-    # Function to convert string to dictionary
-    def convert_salary_string_to_dict(salary_str):
-        try:
-            return json.loads(salary_str)
-        except json.JSONDecodeError:
-            return {}
-
-    # Apply conversion to the salary column
-    data["salary"] = data["salary"].apply(convert_salary_string_to_dict)
-
-    # Function to replace words in lists
-    def replace_words_in_list(data, column_name, replacements):
-        # lowercase all replacements
-        replacements = {
-            key.lower(): value.lower() for key, value in replacements.items()
-        }
-
-        for i, items in data[column_name].items():
-
-            # lowercase all items
-            if isinstance(items, list):
-                items = [item.lower() for item in items if isinstance(item, str)]
-
-            if isinstance(items, list):
-                data.at[i, column_name] = [
-                    replacements.get(item, item) for item in items
-                ]
-            elif isinstance(items, str):
-                data.at[i, column_name] = replacements.get(items, items)
-
-    # Dictionary for replacements
-    replacements = {
-        "PowerBI": "Power BI",
-        "401k": "401(k)",
-        "401(k) plan": "401(k)",
-        "Vision Insurance": "Vision",
-        "Dental Insurance": "Dental",
-        "Medical Insurance": "Medical",
-        "Microsoft Excel": "Excel",
-        "Microsoft Office Suite": "Microsoft Office",
-        "Microsoft Word": "Word",
-        "Tuition Assistance": "Tuition Reimbursement",
-        "PTO": "Paid Time Off",
-        "Competitive Salary": "Competitive Compensation",
-        "Paid Parental Leave": "Parental Leave",
-        "Attention to Detail": "Detail Oriented",
-        "Detail-oriented": "Detail Oriented",
-        "problem-solving": "Problem Solving",
-        "analytical thinking": "Analytical",
-        "analytical skills": "Analytical",
-        "Presentation": "Presentation Skills",
-        "apache spark": "Spark",
-        "apache kafka": "Kafka",
-        "apache hadoop": "Hadoop",
-        "apache airflow": "Airflow",
-        "azure databricks": "Databricks",
-        "google cloud platform": "GCP",
-        "amazon web services": "AWS",
-        "aws services": "AWS",
-        "interpersonal skills": "interpersonal",
-    }
-
-    # Replace words in the specified columns
-    columns_to_replace = [
-        "tech_stack",
-        "hard_skills",
-        "soft_skills",
-        "industries",
-        "company",
-        "benefits",
-    ]
-    for column in columns_to_replace:
-        if column in data.columns:
-            replace_words_in_list(data, column, replacements)
-
-    def get_blacklist_companies():
-        # SQL query to fetch company names from the blacklist table
-        query = """
-        SELECT company
-        FROM `extracted_data.blacklist`
-        """
+    @st.cache_data(ttl=3600)
+    def load_jobs(keyword, company):
+        return get_warehouse().dashboard_jobs(keyword, company, limit=table_rows)
 
-        credentials = service_account.Credentials.from_service_account_file(
-            "keys/gbq.json",
+    @st.cache_resource(ttl=3600)
+    def get_blacklist():
+        return load_blacklist(
+            lambda: get_warehouse().blacklist_companies(), os.getenv("BLACKLIST_CACHE", "state/blacklist.json")
         )
 
-        project_id = "techlistme"
-
-        # Execute the query and load results into a DataFrame
-        df = pandas_gbq.read_gbq(query, project_id=project_id, credentials=credentials)
-
-        # Convert the 'company' column to a list
-        blacklist_companies = df["company"].tolist()
-
-        return blacklist_companies
-
-    # Blacklist of companies
-    blacklist_companies = get_blacklist_companies()
-
-    # Convert company names to lowercase for case-insensitive comparison
-    data["company"] = data["company"].str.lower()
+    blacklist = get_blacklist()
+    blacklist_companies = blacklist.companies
 
-    blacklist_companies = [company.lower() for company in blacklist_companies]
-    blacklist_companies = set(blacklist_companies)
-
-    # Calculate the number of excluded jobs before filtering
-    excluded_jobs_count = data[data["company"].isin(blacklist_companies)].shape[0]
-
-    # Filter out blacklisted companies
-    data = data[~data["company"].isin(blacklist_companies)]
+    term_counts = load_term_counts()
+    salaries = load_salaries().sort_values("oldest")
 
     # Streamlit app layout
     st.title("Dashboard")
 
     # Get the unique keywords for the drop-down menu and add "All"
-    unique_keywords = ["All Data Related Jobs"] + data["keyword"].unique().tolist()
+    unique_keywords = [all_keywords] + salaries.loc[salaries["keyword"] != all_keywords, "keyword"].tolist()
 
     # Drop-down menu for selecting a keyword
     keyword = st.selectbox("Select a job title keyword", unique_keywords)
 
-    # Filter data based on the selected keyword
-    if "All" in keyword:
-        filtered_data = data
-    else:
-        filtered_data = data[data["keyword"] == keyword]
-
-    # Function to count frequency of words in lists, case-insensitively
-    def count_frequency(column_data):
-        all_items = []
-        for item in column_data:
-            if isinstance(item, list):
-                # Filter out empty lists and extend with lowercased items
-                if item:
-                    all_items.extend([i.lower() for i in item if i])
-            elif isinstance(item, str):
-                if item:
-                    all_items.append(item.lower())
-        return Counter(all_items)
-
-    # Function to calculate median min and max salary
-    def calculate_mean_salary(data):
-        min_salaries = [
-            entry["min"]
-            for entry in data
-            if isinstance(entry, dict)
-            and "min" in entry
-            and entry["min"] is not None
-            and entry["min"] >= 20000
-        ]
-        max_salaries = [
-            entry["max"]
-            for entry in data
-            if isinstance(entry, dict)
-            and "max" in entry
-            and entry["max"] is not None
-            and entry["max"] >= 20000
-        ]
-
-        min_salary = np.mean(min_salaries) if min_salaries else 0
-        max_salary = np.mean(max_salaries) if max_salaries else 0
+    # Counts and salaries for the selected keyword
+    filtered_counts = term_counts[term_counts["keyword"] == keyword]
+    summary = salaries[salaries["keyword"] == keyword]
 
-        return min_salary, max_salary
-
-    # Extract salary column from the filtered DataFrame
-    salary_data = filtered_data["salary"].tolist()
-
-    # Calculate median min and max salary
-    min_salary, max_salary = calculate_mean_salary(salary_data)
+    # Mean min and max salary
+    min_salary = summary["min_salary"].iloc[0] if len(summary) else 0
+    max_salary = summary["max_salary"].iloc[0] if len(summary) else 0
 
     # Display the results in Streamlit
     st.write(f"""Avg. Salary Range for {keyword}: \${min_salary:,.2f} - ${max_salary:,.2f}""")
 
     n = st.slider("Number of Top Elements to Display in the Charts", 5, 50, 25, 5)
 
-    # Check if filtered_data is not empty before processing
-    if not filtered_data.empty:
+    # Check if there are jobs for the keyword before charting
+    if not filtered_counts.empty:
         columns = [
             "tech_stack",
             "hard_skills",
@@ -268,12 +99,7 @@ with st.container():
             "benefits",
         ]
 
-        def frequency_counter(data, column):
-            freq = count_frequency(data[column])
-            df = pd.DataFrame(freq.most_common(n), columns=[column, "Frequency"])
-            return df
-
-        dfs = [frequency_counter(filtered_data, column) for column in columns]
+        dfs = [top_terms(filtered_counts, column, n) for column in columns]
 
         # Plotting bar charts with Altair
         def plot_bar_chart(df, x, y, title):
@@ -315,45 +141,47 @@ with st.container():
     else:
         st.write("No data found for the given keyword.")
 
-    oldest_date = filtered_data["time_extracted"].min()
-    most_recent_date = filtered_data["time_extracted"].max()
+    oldest_date = summary["oldest"].iloc[0] if len(summary) else None
+    most_recent_date = summary["newest"].iloc[0] if len(summary) else None
 
     """
     ### Data Table with Company Filter
     """
     x = st.slider(f"How many companies hiring for {keyword} do you want to show in the menu below?", 5, 200, 25, 5)
-    top_x_companies = filtered_data["company"].value_counts().head(x).index.tolist()
+    company_jobs = top_terms(filtered_counts, "company", x)
+    top_x_companies = company_jobs["company"].tolist()
     companies_list = [f"All Companies"] + top_x_companies
     company = st.selectbox(
         f"Select a company from the top {x} hiring for {keyword} (sorted by most to least job postings).",
         companies_list,
     )
 
-    # Filter data based on the selected company
+    # Counts and the newest jobs for the selected company
     if "All Companies" in company:
-        filtered_data = filtered_data
+        company_counts = filtered_counts
+        count = int(summary["jobs"].iloc[0]) if len(summary) else 0
+        company_filter = None
     else:
-        filtered_data = filtered_data[
-            filtered_data["company"].str.lower() == company.lower()
-        ]
+        company_counts = load_company_term_counts(keyword, company)
+        count = int(company_jobs.set_index("company")["Frequency"][company])
+        company_filter = company
+    jobs = load_jobs(None if keyword == all_keywords else keyword, company_filter)
+    filtered_data, _ = prepare_jobs(jobs, blacklist)
 
     st.write(
         "Tip: Adjust the slider to add more company options to the dropdown menu above!"
     )
+    if count > len(filtered_data):
+        st.write(f"The {len(filtered_data)} most recent of {count} jobs:")
     filtered_data
 
     with st.expander("Company Charts"):
 
-        def get_freq_table(df, column_name, n):
-            freq = count_frequency(df[column_name])
-            df = pd.DataFrame(freq.most_common(n), columns=[column_name, "Frequency"])
-            return df
-
-        tech_stack_df = get_freq_table(filtered_data, "tech_stack", n)
-        hard_skills_df = get_freq_table(filtered_data, "hard_skills", n)
-        soft_skills_df = get_freq_table(filtered_data, "soft_skills", n)
-        industries_df = get_freq_table(filtered_data, "industries", n)
-        benefits_df = get_freq_table(filtered_data, "benefits", n)
+        tech_stack_df = top_terms(company_counts, "tech_stack", n)
+        hard_skills_df = top_terms(company_counts, "hard_skills", n)
+        soft_skills_df = top_terms(company_counts, "soft_skills", n)
+        industries_df = top_terms(company_counts, "industries", n)
+        benefits_df = top_terms(company_counts, "benefits", n)
 
         def plot_altair_chart(df, column_name):
             title = column_name.replace("_", " ").title()
@@ -389,5 +217,4 @@ with st.expander("Excluded Companies"):
 
 st.write(f"Oldest data pull: {oldest_date}")
 st.write(f"Recent data pull: {most_recent_date}")
-count = filtered_data.shape[0]
 st.write(f"{count} jobs found for {keyword} at {company.title()}.")
@@ -0,0 +1,219 @@
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from google.api_core import exceptions as google_exceptions
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+search_pages_dir = os.path.join(root, "collect_job_listings", "benchmark", "pages")
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+search_path = "/jobs-guest/jobs/api/seeMoreJobPostings/search"
+job_path = re.compile(r"^/jobs/view/(\d+)$")
+gemini_path = "/gemini/generate"
+job_id_pattern = re.compile(r"urn:li:jobPosting:(\d+)")
+description_start = 'show-more-less-html__markup--clamp-after-5 relative overflow-hidden">'
+
+
+def load_fixtures(pattern):
+    fixtures = []
+    for file_path in sorted(glob.glob(pattern)):
+        with open(file_path, "r", encoding="utf-8") as file:
+            fixtures.append(file.read())
+    return fixtures
+
+
+class FakeServer:
+    """Replays saved LinkedIn pages and Gemini responses over local HTTP.
+
+    Search requests page through the saved search results. Each keyword and
+    location gets its own range of job_ids, so every search finds new jobs
+    the way a real crawl does. Job pages and Gemini responses are picked from
+    the fixtures by job_id and by description; repost_rate is the share of
+    job pages served unchanged, so their description repeats across job_ids.
+    Every response waits latency seconds (give or take jitter, as a fraction)
+    and rate_limit is the share of requests answered with a 429 instead.
+    drop_rate is the share of postings a batched Gemini response leaves out.
+    """
+
+    def __init__(self, latency=0.05, gemini_latency=0.5, jitter=0.5, rate_limit=0.0, drop_rate=0.0,
+                 repost_rate=0.1, seed=0):
+        self.latency = latency
+        self.gemini_latency = gemini_latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.drop_rate = drop_rate
+        self.repost_rate = repost_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}  # (route, status) -> requests
+        self.search_pages = load_fixtures(os.path.join(search_pages_dir, "*.html"))
+        self.job_pages = load_fixtures(os.path.join(fixtures_dir, "job_pages", "*.html"))
+        self.gemini_responses = load_fixtures(os.path.join(fixtures_dir, "gemini", "*.json"))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _delay(self, latency):
+        with self.lock:
+            rate_limited = self.random.random() < self.rate_limit
+            delay = latency * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(delay)
+        return rate_limited
+
+    def _count(self, route, status):
+        with self.lock:
+            self.counts[(route, status)] = self.counts.get((route, status), 0) + 1
+
+    def search_page(self, keywords, location, start):
+        """The saved page for this offset, with job_ids moved into the search's own range."""
+        index = start // 10
+        if index >= len(self.search_pages):
+            return ""
+        offset = zlib.crc32(f"{keywords}|{location}".encode()) % 1000 * 10**10
+        return job_id_pattern.sub(
+            lambda match: f"urn:li:jobPosting:{int(match.group(1)) + offset}", self.search_pages[index]
+        )
+
+    def job_page(self, job_id):
+        """The saved page for this job_id, made unique by a requisition number unless it is a repost."""
+        page = self.job_pages[job_id % len(self.job_pages)]
+        if zlib.crc32(str(job_id).encode()) % 1000 < self.repost_rate * 1000:
+            return page
+        return page.replace(description_start, f"{description_start}\n<p>Requisition {job_id}</p>", 1)
+
+    def canned_response(self, description):
+        return self.gemini_responses[zlib.crc32(description.encode()) % len(self.gemini_responses)]
+
+    def gemini_response(self, prompt):
+        """A canned response for a description, or an array of them for a batch of postings."""
+        try:
+            postings = json.loads(prompt)
+        except ValueError:
+            postings = None
+        if isinstance(postings, list):
+            items = []
+            for posting in postings:
+                with self.lock:
+                    dropped = self.random.random() < self.drop_rate
+                if not dropped:
+                    items.append({"job_id": posting["job_id"], **json.loads(self.canned_response(posting["description"]))})
+            text = json.dumps(items)
+        else:
+            text = self.canned_response(prompt)
+        # Roughly four characters per token, like the real tokenizer on English text
+        return {
+            "text": text,
+            "usage_metadata": {"prompt_token_count": len(prompt) // 4, "candidates_token_count": len(text) // 4},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, route, status, body, content_type="text/html; charset=utf-8"):
+                server._count(route, status)
+                body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                match = job_path.match(url.path)
+                if url.path == search_path:
+                    route = "search"
+                elif match:
+                    route = "job"
+                else:
+                    return self._send("unknown", 404, "")
+
+                if server._delay(server.latency):
+                    return self._send(route, 429, "")
+                if route == "search":
+                    params = parse_qs(url.query)
+                    page = server.search_page(
+                        params.get("keywords", [""])[0],
+                        params.get("location", [""])[0],
+                        int(params.get("start", ["0"])[0]),
+                    )
+                    return self._send(route, 200, page)
+                return self._send(route, 200, server.job_page(int(match.group(1))))
+
+            def do_POST(self):
+                prompt = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                if self.path != gemini_path:
+                    return self._send("unknown", 404, "")
+                if server._delay(server.gemini_latency):
+                    return self._send("gemini", 429, "Resource has been exhausted (e.g. check quota).")
+                body = json.dumps(server.gemini_response(prompt))
+                return self._send("gemini", 200, body, content_type="application/json")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = UsageMetadata(**usage_metadata)
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel, sending each prompt to a FakeServer.
+
+    Error statuses raise the google.api_core exception the real client
+    raises for them, so a 429 is retried like a real one.
+    """
+
+    def __init__(self, url, model_name=None, generation_config=None, system_instruction=None):
+        self.url = url + gemini_path
+        self.model_name = model_name
+
+    def generate_content(self, contents):
+        request = urllib.request.Request(self.url, data=contents.encode("utf-8"), method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise google_exceptions.from_http_status(e.code, e.read().decode("utf-8")) from e
+        return FakeResponse(body["text"], body["usage_metadata"])
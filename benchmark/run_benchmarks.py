@@ -0,0 +1,229 @@
+import argparse
+import functools
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from fakes import FakeGenerativeModel, FakeServer
+
+# The stages are imported like run_pipeline.py does, after the environment
+# points them at the fake server and a throwaway local warehouse
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stage_dirs = ["collect_job_listings", "enrich_job_listings", "extract_gemini", "aggregate_dashboard"]
+sys.path[:0] = [root] + [os.path.join(root, stage_dir) for stage_dir in stage_dirs]
+
+sample_path = os.path.join(root, "data", "sample.csv")
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, round(q * (len(samples) - 1)))] if samples else 0.0
+
+
+def report(name, count, unit, elapsed, latencies, note=""):
+    print(
+        f"{name:<24} {count:>7} {unit:<9} {elapsed:8.2f}s {count / elapsed:10.1f} {unit}/sec"
+        f"  p50 {percentile(latencies, 0.5) * 1000:9.1f}ms  p99 {percentile(latencies, 0.99) * 1000:9.1f}ms"
+        f"  {note}"
+    )
+
+
+def timed(function, latencies):
+    """function, recording each call's duration in latencies."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start_time)
+    return wrapper
+
+
+def benchmark_collect(collect, warehouse, searches):
+    """process_jobs for the first searches keyword/location pairs, on the crawler's own pool."""
+    pairs = [(keyword, location) for keyword in collect.keywords for location in collect.locations][:searches]
+    latencies = []
+    process_jobs = timed(collect.process_jobs, latencies)
+    start_time = time.perf_counter()
+    with collect.create_sink() as sink, ThreadPoolExecutor(max_workers=collect.max_concurrency) as executor:
+        for future in [
+            executor.submit(process_jobs, keyword, location, uuid.uuid4().hex, sink) for keyword, location in pairs
+        ]:
+            future.result()
+    elapsed = time.perf_counter() - start_time
+    jobs = warehouse.count("raw_data.jobs")
+    report("process_jobs", len(pairs), "searches", elapsed, latencies, f"{jobs} jobs ({jobs / elapsed:.1f}/sec)")
+
+
+def benchmark_enrich(enrich, warehouse):
+    """enrich_jobs over every collected job; latency is per job_detail_request."""
+    jobs = len(warehouse.jobs_without_description())
+    latencies = []
+    enrich.job_detail_request = timed(enrich.job_detail_request, latencies)
+    start_time = time.perf_counter()
+    enrich.enrich_jobs()
+    elapsed = time.perf_counter() - start_time
+    missing = len(warehouse.jobs_without_description())
+    report("enrich_jobs", jobs, "jobs", elapsed, latencies, f"{missing} still without a description")
+
+
+def benchmark_extract(extract, warehouse, server, jobs, batch_size, batch_prediction=False):
+    """extract_job_description on batches of remaining jobs; latency is per batch.
+
+    With batch_prediction, all the jobs go in one job of the local batch prediction stand-in.
+    """
+    latencies = []
+    extract_job_description = timed(extract.extract_job_description, latencies)
+    if batch_prediction:
+        batch_size = jobs
+        extract_job_description = functools.partial(extract_job_description, extract=extract.extract_batch_prediction)
+    done = 0
+    start_time = time.perf_counter()
+    while done < jobs:
+        batch = extract.load_remaining_jobs(batch_size=min(batch_size, jobs - done))
+        if not batch:
+            break
+        extract_job_description(extract.clean(batch))
+        done += len(batch)
+    elapsed = time.perf_counter() - start_time
+    bad = warehouse.count("raw_data.bad_jobs")
+    requests = sum(count for (route, _), count in server.counts.items() if route == "gemini")
+    saved = sum(metrics.boilerplate_tokens_saved.values.values())
+    report(
+        "extract_job_description", done, "jobs", elapsed, latencies,
+        f"batches of {batch_size}, {requests} Gemini requests, {bad} bad jobs, {saved} boilerplate tokens saved",
+    )
+
+
+def benchmark_dashboard(aggregate, warehouse, rows, rounds, top_n=25):
+    """The aggregate stage over rows extracted jobs copied from data/sample.csv, then the app's load and prep."""
+    from common.dashboard_data import all_keywords, chart_columns, company_chart_columns, top_terms
+
+    sample = pd.read_csv(sample_path)
+    copies = pd.concat([sample] * (rows // len(sample) + 1), ignore_index=True).head(rows)
+    copies["job_id"] = range(9000000000, 9000000000 + len(copies))
+    copies["description_hash"] = None
+    warehouse.append_export("extracted_data.jobs", copies)
+
+    jobs = warehouse.count("extracted_data.jobs")
+    start_time = time.perf_counter()
+    aggregate.run()
+    elapsed = time.perf_counter() - start_time
+    report("aggregate_dashboard", jobs, "jobs", elapsed, [elapsed])
+
+    load_latencies = []
+    prep_latencies = []
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        term_counts = warehouse.dashboard_term_counts()
+        warehouse.dashboard_salaries()
+        load_latencies.append(time.perf_counter() - start_time)
+
+        # The default page: every keyword, then the top company's charts
+        start_time = time.perf_counter()
+        counts = term_counts[term_counts["keyword"] == all_keywords]
+        for column in chart_columns:
+            top_terms(counts, column, top_n)
+        company = top_terms(counts, "company", 1)["company"].iloc[0]
+        company_counts = warehouse.dashboard_company_term_counts(all_keywords, company)
+        for column in company_chart_columns:
+            top_terms(company_counts, column, top_n)
+        prep_latencies.append(time.perf_counter() - start_time)
+
+    count = len(term_counts)
+    report("dashboard load", count * rounds, "rows", sum(load_latencies), load_latencies, f"{rounds} rounds")
+    report("dashboard prep", count * rounds, "rows", sum(prep_latencies), prep_latencies, f"{rounds} rounds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay saved LinkedIn pages and Gemini responses through the pipeline, with no network"
+    )
+    parser.add_argument("--searches", type=int, default=12, help="keyword/location searches to collect (max 108)")
+    parser.add_argument("--extract-jobs", type=int, default=200, help="jobs sent to the fake Gemini")
+    parser.add_argument("--extract-batch-size", type=int, default=20)
+    parser.add_argument("--dashboard-rows", type=int, default=20000)
+    parser.add_argument("--dashboard-rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake LinkedIn response")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="seconds per fake Gemini response")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency varies by up to this fraction")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument(
+        "--gemini-drop-rate", type=float, default=0.0, help="share of postings left out of batched Gemini responses"
+    )
+    parser.add_argument(
+        "--repost-rate", type=float, default=0.1, help="share of job pages whose description repeats across job_ids"
+    )
+    parser.add_argument("--extract-cache", action="store_true", help="extract with EXTRACT_CACHE in the temp dir")
+    parser.add_argument(
+        "--extract-batch-prediction", action="store_true",
+        help="extract through the local batch prediction stand-in instead of online requests",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the stages' INFO logging")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, FakeServer(
+        latency=args.latency, gemini_latency=args.gemini_latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, drop_rate=args.gemini_drop_rate,
+        repost_rate=args.repost_rate, seed=args.seed,
+    ) as server:
+        os.environ.update(
+            WAREHOUSE="duckdb",
+            WAREHOUSE_PATH=f"{tmp}/warehouse",
+            BLACKLIST_CACHE=f"{tmp}/blacklist.json",
+            COLLECT_JOB_ID_INDEX=f"{tmp}/job_ids.npy",
+            ENRICH_JOURNAL=f"{tmp}/enrich_journal.sqlite",
+            ENRICH_STAGE_DIR=f"{tmp}/staged",
+            LINKEDIN_URL=server.url,
+        )
+        if args.extract_cache:
+            os.environ["EXTRACT_CACHE"] = f"{tmp}/extraction_cache.sqlite"
+        if args.extract_batch_prediction:
+            os.environ.update(
+                EXTRACT_BATCH_PREDICTION="local",
+                EXTRACT_BATCH_PREDICTION_URI=f"{tmp}/batch_prediction",
+                EXTRACT_BATCH_PREDICTION_POLL_SECONDS="0.1",
+            )
+        # Backoffs short enough for a laptop run, unless set explicitly
+        os.environ.setdefault("COLLECT_REQUESTS_PER_SECOND", "1000")
+        os.environ.setdefault("COLLECT_RATE_LIMIT_BACKOFF", "1")
+        os.environ.setdefault("ENRICH_RATE_LIMIT_BACKOFF", "0.5")
+
+        import aggregate_dashboard as aggregate
+        import collect_job_listings as collect
+        import enrich_job_listings as enrich
+        import extract_gemini as extract
+        from common import metrics
+        from common.warehouse import get_warehouse
+
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        # The stages only size the pool of their https adapter; the fake server is plain http
+        for module in [collect, enrich]:
+            module.session.mount("http://", module.session.get_adapter("https://"))
+        extract.genai = types.SimpleNamespace(GenerativeModel=functools.partial(FakeGenerativeModel, server.url))
+
+        warehouse = get_warehouse()
+        print(
+            f"fake server at {server.url} - latency {args.latency}s, Gemini {args.gemini_latency}s, "
+            f"429 rate {args.rate_limit}"
+        )
+        benchmark_collect(collect, warehouse, args.searches)
+        benchmark_enrich(enrich, warehouse)
+        benchmark_extract(
+            extract, warehouse, server, args.extract_jobs, args.extract_batch_size, args.extract_batch_prediction
+        )
+        benchmark_dashboard(aggregate, warehouse, args.dashboard_rows, args.dashboard_rounds)
+
+        responses = ", ".join(f"{route} {status}: {count}" for (route, status), count in sorted(server.counts.items()))
+        print(f"fake server responses - {responses}")
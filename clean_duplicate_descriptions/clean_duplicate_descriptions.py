@@ -1,6 +1,8 @@
-from google.cloud import bigquery
-from google.oauth2 import service_account
 import logging
+import os
+from common import metrics
+from common.warehouse import extracted_jobs, get_warehouse, raw_jobs
+from near_duplicates import near_duplicate_groups
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -8,167 +10,119 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-# Configure BigQuery credentials
-credentials = service_account.Credentials.from_service_account_file("keys/gbq.json")
-project_id = "techlistme"
-raw_dataset_id = "raw_data"
-extracted_dataset_id = "extracted_data"
-raw_table_id = "jobs"
-extracted_table_id = "jobs"
+# BigQuery, or a local DuckDB/Parquet warehouse when WAREHOUSE=duckdb
+warehouse = get_warehouse()
 
-client = bigquery.Client(credentials=credentials, project=project_id)
+# Near-duplicate settings: estimated Jaccard similarity over word shingles at
+# which two descriptions count as the same posting, and how far back to
+# compare new postings against already extracted ones
+near_duplicate_threshold = float(os.getenv("DEDUP_NEAR_THRESHOLD", "0.9"))
+near_duplicate_lookback_days = int(os.getenv("DEDUP_NEAR_LOOKBACK_DAYS", "30"))
 
+# "incremental" only looks at rows newer than the stored watermarks and deletes
+# the losing rows; "compact" rewrites both tables in full (the original path)
+dedup_mode = os.getenv("DEDUP_MODE", "incremental")
+# Rows can land with a created_on slightly older than the last watermark (the
+# collector stamps rows before uploading), so each run re-reads this overlap
+watermark_overlap = 86400
 
-def deduplicate_and_clean():
-    temp_table_id = f"{project_id}.{raw_dataset_id}.jobs_deduplicated"
-
-    clean_query = f"""
-    CREATE OR REPLACE TABLE `{temp_table_id}` AS
-    WITH ranked_jobs AS (
-      SELECT *,
-             ROW_NUMBER() OVER (
-               PARTITION BY CASE 
-                 WHEN description IS NULL THEN CONCAT(job_id, '_null')
-                 ELSE description 
-               END
-               ORDER BY created_on DESC
-             ) AS row_num
-      FROM `{project_id}.{raw_dataset_id}.{raw_table_id}`
-    )
-    SELECT j.* EXCEPT(row_num)
-    FROM ranked_jobs j
-    LEFT JOIN `{project_id}.{extracted_dataset_id}.{extracted_table_id}` e
-      ON j.job_id = e.job_id
-    WHERE j.row_num = 1 AND e.job_id IS NULL;
-    """
-
-    # Execute the cleaning query
-    job = client.query(clean_query)
-    job.result()  # Wait for the query to complete
 
-    # Get the number of rows in the original and cleaned tables
-    original_count_query = (
-        f"SELECT COUNT(*) as count FROM `{project_id}.{raw_dataset_id}.{raw_table_id}`"
-    )
-    original_count_job = client.query(original_count_query)
-    original_count = next(original_count_job.result())[0]
-
-    cleaned_count_query = f"SELECT COUNT(*) as count FROM `{temp_table_id}`"
-    cleaned_count_job = client.query(cleaned_count_query)
-    cleaned_count = next(cleaned_count_job.result())[0]
-
-    # Replace the original table with the cleaned table
-    replace_query = f"""
-    CREATE OR REPLACE TABLE `{project_id}.{raw_dataset_id}.{raw_table_id}` AS
-    SELECT * FROM `{temp_table_id}`;
-    """
-    job = client.query(replace_query)
-    job.result()  # Wait for the query to complete
+def backfill_description_hashes(since=0.0):
+    """Add description_hash to the job tables and fill it for rows written before enrichment set it."""
+    for table, count in warehouse.backfill_description_hashes(since).items():
+        if count:
+            logging.info(f"Backfilled description_hash for {count} rows in {table}")
 
-    # Drop the temporary table
-    client.delete_table(temp_table_id, not_found_ok=True)
 
+def deduplicate_and_clean():
+    original_count, cleaned_count = warehouse.compact_raw_jobs()
     logging.info(
         f"Raw data deduplication complete. Rows before: {original_count}, Rows after: {cleaned_count}"
     )
 
 
 def deduplicate_extracted_data():
-    temp_table_id = f"{project_id}.{extracted_dataset_id}.jobs_deduplicated"
-
-    clean_query = f"""
-    CREATE OR REPLACE TABLE `{temp_table_id}` AS
-    WITH ranked_jobs AS (
-      SELECT *,
-             ROW_NUMBER() OVER (
-               PARTITION BY job_id
-               ORDER BY created_on DESC
-             ) AS job_id_rank,
-             ROW_NUMBER() OVER (
-               PARTITION BY description
-               ORDER BY created_on DESC
-             ) AS description_rank
-      FROM `{project_id}.{extracted_dataset_id}.{extracted_table_id}`
-    )
-    SELECT * EXCEPT(job_id_rank, description_rank)
-    FROM ranked_jobs
-    WHERE job_id_rank = 1 AND description_rank = 1;
-    """
-
-    # Execute the cleaning query
-    job = client.query(clean_query)
-    job.result()  # Wait for the query to complete
-
-    # Get the number of rows in the original and cleaned tables
-    original_count_query = f"SELECT COUNT(*) as count FROM `{project_id}.{extracted_dataset_id}.{extracted_table_id}`"
-    original_count_job = client.query(original_count_query)
-    original_count = next(original_count_job.result())[0]
-
-    cleaned_count_query = f"SELECT COUNT(*) as count FROM `{temp_table_id}`"
-    cleaned_count_job = client.query(cleaned_count_query)
-    cleaned_count = next(cleaned_count_job.result())[0]
-
-    # Replace the original table with the cleaned table
-    replace_query = f"""
-    CREATE OR REPLACE TABLE `{project_id}.{extracted_dataset_id}.{extracted_table_id}` AS
-    SELECT * FROM `{temp_table_id}`;
-    """
-    job = client.query(replace_query)
-    job.result()  # Wait for the query to complete
-
-    # Drop the temporary table
-    client.delete_table(temp_table_id, not_found_ok=True)
-
+    original_count, cleaned_count = warehouse.compact_extracted_jobs()
     logging.info(
         f"Extracted data deduplication complete. Rows before: {original_count}, Rows after: {cleaned_count}"
     )
 
 
 def remove_processed_jobs():
-    temp_table_id = f"{project_id}.{raw_dataset_id}.jobs_unprocessed"
-
-    cleanup_query = f"""
-    CREATE OR REPLACE TABLE `{temp_table_id}` AS
-    SELECT r.*
-    FROM `{project_id}.{raw_dataset_id}.{raw_table_id}` r
-    LEFT JOIN `{project_id}.{extracted_dataset_id}.{extracted_table_id}` e
-    ON r.job_id = e.job_id
-    WHERE e.job_id IS NULL;
-    """
+    original_count, cleaned_count = warehouse.remove_processed_jobs()
+    removed_count = original_count - cleaned_count
+    logging.info(
+        f"Processed job removal complete. Rows before: {original_count}, Rows after: {cleaned_count}, Removed: {removed_count}"
+    )
 
-    # Execute the cleanup query
-    job = client.query(cleanup_query)
-    job.result()  # Wait for the query to complete
 
-    # Get the number of rows in the original and cleaned tables
-    original_count_query = (
-        f"SELECT COUNT(*) as count FROM `{project_id}.{raw_dataset_id}.{raw_table_id}`"
-    )
-    original_count_job = client.query(original_count_query)
-    original_count = next(original_count_job.result())[0]
+def deduplicate_incremental(raw_since, extracted_since):
+    """Incremental versions of the three full rewrites, touching only rows after the watermarks."""
+    raw_removed, extracted_removed, processed_removed = warehouse.deduplicate_incremental(raw_since, extracted_since)
+    logging.info(f"Incremental raw data deduplication complete. Removed: {raw_removed}")
+    logging.info(f"Incremental extracted data deduplication complete. Removed: {extracted_removed}")
+    logging.info(f"Incremental processed job removal complete. Removed: {processed_removed}")
 
-    cleaned_count_query = f"SELECT COUNT(*) as count FROM `{temp_table_id}`"
-    cleaned_count_job = client.query(cleaned_count_query)
-    cleaned_count = next(cleaned_count_job.result())[0]
 
-    # Replace the original table with the cleaned table
-    replace_query = f"""
-    CREATE OR REPLACE TABLE `{project_id}.{raw_dataset_id}.{raw_table_id}` AS
-    SELECT * FROM `{temp_table_id}`;
-    """
-    job = client.query(replace_query)
-    job.result()  # Wait for the query to complete
+def remove_near_duplicates():
+    """Drop pending raw jobs whose description nearly matches another posting.
 
-    # Drop the temporary table
-    client.delete_table(temp_table_id, not_found_ok=True)
+    Pending raw jobs are compared with each other and with jobs extracted in
+    the last DEDUP_NEAR_LOOKBACK_DAYS days. In each group of near duplicates
+    the newest pending job is kept, unless the group already has an extracted
+    job, in which case every pending job in it is dropped.
+    """
+    pending, extracted = warehouse.near_duplicate_candidates(near_duplicate_lookback_days * 86400)
+    if pending.empty:
+        return
+
+    descriptions = {("pending", row.job_id): row.description for row in pending.itertuples()}
+    descriptions.update({("extracted", row.job_id): row.description for row in extracted.itertuples()})
+    created_on = dict(zip(pending["job_id"], pending["created_on"]))
+
+    losers = set()
+    for group in near_duplicate_groups(descriptions, threshold=near_duplicate_threshold):
+        pending_ids = [job_id for source, job_id in group if source == "pending"]
+        if len(pending_ids) < len(group):
+            losers.update(pending_ids)
+        else:
+            newest = max(pending_ids, key=created_on.get)
+            losers.update(job_id for job_id in pending_ids if job_id != newest)
+
+    if losers:
+        warehouse.delete_jobs(raw_jobs, losers)
 
-    removed_count = original_count - cleaned_count
     logging.info(
-        f"Processed job removal complete. Rows before: {original_count}, Rows after: {cleaned_count}, Removed: {removed_count}"
+        f"Near-duplicate removal complete. Pending jobs: {len(pending)}, Removed: {len(losers)}"
     )
 
 
+def run():
+    """One deduplication pass: a full compaction the first time or with DEDUP_MODE=compact, else incremental."""
+    watermarks = warehouse.get_watermarks()
+    # Read the new watermarks first so rows landing during this run are picked up next time
+    raw_watermark = warehouse.max_created_on(raw_jobs)
+    extracted_watermark = warehouse.max_created_on(extracted_jobs)
+
+    if dedup_mode == "compact" or not watermarks:
+        logging.info("Running full compaction")
+        backfill_description_hashes()
+        deduplicate_and_clean()
+        remove_near_duplicates()
+        deduplicate_extracted_data()
+        remove_processed_jobs()
+    else:
+        raw_since = max(watermarks.get("raw", 0.0) - watermark_overlap, 0.0)
+        extracted_since = max(watermarks.get("extracted", 0.0) - watermark_overlap, 0.0)
+        logging.info(f"Running incremental deduplication - raw since: {raw_since} - extracted since: {extracted_since}")
+        backfill_description_hashes(since=min(raw_since, extracted_since))
+        deduplicate_incremental(raw_since, extracted_since)
+        remove_near_duplicates()
+
+    warehouse.set_watermark("raw", raw_watermark)
+    warehouse.set_watermark("extracted", extracted_watermark)
+
+
 if __name__ == "__main__":
-    deduplicate_and_clean()
-    deduplicate_extracted_data()
-    remove_processed_jobs()
+    metrics.start_exporter()
+    run()
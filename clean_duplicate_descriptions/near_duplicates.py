@@ -0,0 +1,74 @@
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from common.fingerprint import normalize_description
+
+_prime = np.uint64((1 << 61) - 1)
+
+
+class MinHasher:
+    """MinHash signatures over word shingles of the normalized description."""
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, _prime, num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _prime, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        words = normalize_description(text).split()
+        k = self.shingle_size
+        shingles = {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        # One universal hash per permutation; uint64 overflow is fine for MinHash
+        return ((np.outer(hashes, self.a) + self.b) % _prime).min(axis=0)
+
+
+def choose_bands(num_perm, threshold):
+    """(bands, rows) whose LSH S-curve midpoint (1/bands)^(1/rows) is closest to, but not above, threshold."""
+    splits = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [split for split in splits if (1 / split[0]) ** (1 / split[1]) <= threshold]
+    return max(below, key=lambda split: (1 / split[0]) ** (1 / split[1]))
+
+
+def near_duplicate_groups(descriptions, threshold=0.9, num_perm=128):
+    """Groups of ids whose descriptions have estimated Jaccard similarity >= threshold.
+
+    descriptions maps id -> description text. Only groups with more than one
+    id are returned. Candidates come from LSH buckets and are confirmed on
+    their full signatures before being joined.
+    """
+    hasher = MinHasher(num_perm=num_perm)
+    signatures = {key: hasher.signature(text) for key, text in descriptions.items()}
+    bands, rows = choose_bands(num_perm, threshold)
+
+    buckets = defaultdict(list)
+    for key, signature in signatures.items():
+        for band in range(bands):
+            buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(key)
+
+    parent = {key: key for key in signatures}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for members in buckets.values():
+        first = members[0]
+        for other in members[1:]:
+            if find(first) == find(other):
+                continue
+            if np.mean(signatures[first] == signatures[other]) >= threshold:
+                parent[find(other)] = find(first)
+
+    groups = defaultdict(list)
+    for key in signatures:
+        groups[find(key)].append(key)
+    return [group for group in groups.values() if len(group) > 1]
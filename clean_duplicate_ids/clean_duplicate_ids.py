@@ -1,6 +1,6 @@
-from google.oauth2 import service_account
-from google.cloud import bigquery
 import logging
+from common import metrics
+from common.warehouse import get_warehouse
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -9,58 +9,21 @@ logging.basicConfig(
     encoding="utf-8",
 )
 
-# Configure BigQuery credentials
-credentials = service_account.Credentials.from_service_account_file("keys/gbq.json")
-project_id = "techlistme"
-dataset_id = "raw_data"
-table_id = "jobs"
-
-client = bigquery.Client(credentials=credentials, project=project_id)
+warehouse = get_warehouse()
 
 def check_for_duplicates():
-    query = f"""
-    SELECT job_id, COUNT(*) as count
-    FROM `{project_id}.{dataset_id}.{table_id}`
-    GROUP BY job_id
-    HAVING count > 1;
-    """
-    duplicates = client.query(query).result()
-    return len(list(duplicates)) > 0
+    # The collector upserts on job_id, so this is normally a verification
+    # that returns a single boolean rather than the duplicate rows
+    return warehouse.has_duplicate_job_ids()
 
 def clean_duplicate_ids():
-    temp_table_id = f"{project_id}.{dataset_id}.jobs_clean"
-
-    # Create a temporary table with unique job IDs
-    clean_query = f"""
-    CREATE OR REPLACE TABLE `{temp_table_id}` AS
-    SELECT 
-        ANY_VALUE(description) as description,
-        ANY_VALUE(task_id) as task_id,
-        ANY_VALUE(keyword) as keyword,
-        ANY_VALUE(location) as location,
-        ANY_VALUE(company) as company,
-        ANY_VALUE(title) as title,
-        ANY_VALUE(url) as url,
-        job_id,
-        MAX(created_on) as created_on
-    FROM `{project_id}.{dataset_id}.{table_id}`
-    GROUP BY job_id;
-    """
-    client.query(clean_query).result()
-
-    # Replace the original table with the cleaned table
-    replace_query = f"""
-    CREATE OR REPLACE TABLE `{project_id}.{dataset_id}.{table_id}` AS
-    SELECT * FROM `{temp_table_id}`;
-    """
-    client.query(replace_query).result()
-
-    # Optionally, drop the temporary table
-    client.delete_table(temp_table_id, not_found_ok=True)
+    # Keep the newest row of each job_id in a single rewrite, with every column
+    warehouse.deduplicate_job_ids()
 
-    logging.info("Duplicate job IDs have been cleaned from BigQuery")
+    logging.info("Duplicate job IDs have been cleaned from the warehouse")
 
 if __name__ == "__main__":
+    metrics.start_exporter()
     if check_for_duplicates():
         clean_duplicate_ids()
     else:
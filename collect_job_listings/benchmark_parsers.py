@@ -0,0 +1,56 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+from html_parsers import parsers
+
+pages_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark", "pages")
+
+
+def load_pages(path=pages_dir):
+    pages = []
+    for file_path in sorted(glob.glob(os.path.join(path, "*.html"))):
+        with open(file_path, "r", encoding="utf-8") as file:
+            pages.append((os.path.basename(file_path), file.read()))
+    return pages
+
+
+def check_identical(pages):
+    """Every backend must return exactly what the bs4 reference returns."""
+    mismatches = 0
+    for name, page in pages:
+        expected = parsers["bs4"](page)
+        for backend, parse in parsers.items():
+            if parse(page) != expected:
+                print(f"MISMATCH {backend} on {name}")
+                mismatches += 1
+    return mismatches == 0
+
+
+def benchmark(pages, rounds):
+    for backend, parse in parsers.items():
+        start_time = time.perf_counter()
+        cards = 0
+        for _ in range(rounds):
+            for _, page in pages:
+                cards += len(parse(page))
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{backend:>5}: {len(pages) * rounds / elapsed:8.1f} pages/sec "
+            f"{cards / elapsed:9.1f} cards/sec ({elapsed:.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark search page parsers on saved pages")
+    parser.add_argument("--pages", default=pages_dir, help="directory of saved search result pages")
+    parser.add_argument("--rounds", type=int, default=20, help="passes over the corpus per backend")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    print(f"{len(pages)} pages, backends: {', '.join(parsers)}")
+    if not check_identical(pages):
+        sys.exit("Parser backends disagree with the bs4 reference")
+    benchmark(pages, args.rounds)
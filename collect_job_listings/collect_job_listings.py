@@ -1,14 +1,21 @@
-import re
+import os
 import requests
 import ssl
+import threading
 import uuid
-from bs4 import BeautifulSoup
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 from fake_useragent import UserAgent
 import logging
-import pandas as pd
-from google.oauth2 import service_account
-import pandas_gbq
+from common import metrics
+from common.company_matcher import load_blacklist
+from common.warehouse import get_warehouse
+from job_id_index import JobIdIndex
+from pagination import PaginationController
+from html_parsers import get_parser
+from sink import BatchSink, JsonlWriter, WarehouseWriter
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -20,66 +27,126 @@ logging.basicConfig(
 ssl._create_default_https_context = ssl._create_unverified_context
 user_agent = UserAgent()
 
-# Configure BigQuery credentials
-credentials = service_account.Credentials.from_service_account_file("keys/gbq.json")
-project_id = "techlistme"
-table_id = "raw_data.jobs"
-
-def get_blacklist_companies(project_id="techlistme"):
-    # SQL query to fetch company names from the blacklist table
-    query = """
-    SELECT company
-    FROM `extracted_data.blacklist`
-    """
-
-    # Execute the query and load results into a DataFrame
-    df = pandas_gbq.read_gbq(query, project_id=project_id, credentials=credentials)
-
-    # Convert the 'company' column to a list
-    blacklist_companies = df['company'].tolist()
-
-    return blacklist_companies
-
-blacklist = get_blacklist_companies()
-blacklist = [company.lower() for company in blacklist]
-
-
-def load_existing_job_ids():
-    query = """
-    WITH raw_jobs_count AS (
-        SELECT COUNT(*) as count
-        FROM `raw_data.jobs`
-    ),
-    all_jobs AS (
-        SELECT job_id, 'raw' as source FROM `raw_data.jobs`
-        UNION ALL
-        SELECT job_id, 'extracted' as source FROM `extracted_data.jobs`
-        UNION ALL
-        SELECT job_id, 'bad' as source FROM `raw_data.bad_jobs`
-    )
-    SELECT DISTINCT job_id
-    FROM all_jobs
-    WHERE (SELECT count FROM raw_jobs_count) > 0
-       OR source != 'raw'
-    """
-    df = pandas_gbq.read_gbq(query, project_id=project_id, credentials=credentials)
-    logging.info(f"Loaded {len(df)} existing job IDs from BigQuery")
-    return set(df["job_id"])
-
-# Store existing job IDs in memory
-existing_job_ids = load_existing_job_ids()
+# BigQuery, or a local DuckDB/Parquet warehouse when WAREHOUSE=duckdb
+warehouse = get_warehouse()
+
+# Crawl settings: how many keyword/location searches run at once and how many
+# requests per second each host (linkedin.com) may receive across all of them
+max_concurrency = int(os.getenv("COLLECT_CONCURRENCY", "8"))
+requests_per_second = float(os.getenv("COLLECT_REQUESTS_PER_SECOND", "2"))
+rate_limit_backoff = float(os.getenv("COLLECT_RATE_LIMIT_BACKOFF", "10"))
+
+# Overridden to point the crawler at a stand-in, such as benchmark/fakes.py
+linkedin_url = os.getenv("LINKEDIN_URL", "https://www.linkedin.com")
+
+# Pagination settings: a search stops after this many pages in a row without a
+# new job_id, after this many failed attempts at one offset, or at max_offset
+saturation_pages = int(os.getenv("COLLECT_SATURATION_PAGES", "3"))
+max_page_retries = int(os.getenv("COLLECT_MAX_PAGE_RETRIES", "3"))
+max_offset = int(os.getenv("COLLECT_MAX_OFFSET", "1000"))
+page_size = 10
+
+# Where collected jobs go ("warehouse" or "jsonl") and when batches flush
+sink_backend = os.getenv("COLLECT_SINK", "warehouse")
+sink_path = os.getenv("COLLECT_SINK_PATH", "state/jobs.jsonl")
+flush_rows = int(os.getenv("COLLECT_FLUSH_ROWS", "500"))
+flush_bytes = int(os.getenv("COLLECT_FLUSH_BYTES", "1000000"))
+flush_seconds = float(os.getenv("COLLECT_FLUSH_SECONDS", "30"))
+
+# Search page parser backend: "lxml" (fast) or "bs4" (reference)
+parse_cards = get_parser(os.getenv("COLLECT_HTML_PARSER", "lxml"))
+
+# Every keyword is searched in every location
+keywords = [
+    "Data Scientist",
+    "ML Engineer",
+    "Data Analyst",
+    "Data Engineer",
+    "Business Analyst",
+    "Software Engineer",
+    "MLOps Engineer",
+    "AI Engineer",
+    "Decision Scientist",
+]
+
+locations = [
+    "Michigan",
+    "Illinois",
+    "California",
+    "New York",
+    "Washington",
+    "Texas",
+    "Florida",
+    "Massachusetts",
+    "Wisconsin",
+    "Georgia",
+    "Washington D.C.",
+    "United States",
+]
+
+
+class HostRateLimiter:
+    """Spaces out requests per host, shared by every crawler thread."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_slot = {}  # host -> monotonic time of the next free request slot
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def penalize(self, url, seconds):
+        """Hold back all requests to the host, e.g. after a 429."""
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            self.next_slot[host] = max(self.next_slot.get(host, now), now + seconds)
+
+
+def create_session(pool_size):
+    # One keep-alive connection per worker, reused across pages and searches
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+
+session = create_session(max_concurrency)
+rate_limiter = HostRateLimiter(requests_per_second)
+
+blacklist = load_blacklist(warehouse.blacklist_companies, os.getenv("BLACKLIST_CACHE", "state/blacklist.json"))
+
+
+def load_job_ids_since(created_on):
+    """job_ids from every stage's table that were written after created_on."""
+    df = warehouse.job_ids_since(created_on)
+    logging.info(f"Loaded {len(df)} job IDs created after {created_on} from the warehouse")
+    return df
+
+
+# Local index of existing job IDs; only rows newer than its watermark are fetched
+existing_job_ids = JobIdIndex(os.getenv("COLLECT_JOB_ID_INDEX", "state/job_ids.npy"))
+existing_job_ids.refresh(load_job_ids_since)
 
 
 def job_exists(job_id):
     return job_id in existing_job_ids
 
 
-def upload_to_bigquery(job_data):
-    df = pd.DataFrame(job_data)
-    pandas_gbq.to_gbq(
-        df, table_id, project_id, if_exists="append", credentials=credentials
+def create_sink(on_flush=None):
+    if sink_backend == "jsonl":
+        writer = JsonlWriter(sink_path)
+    else:
+        writer = WarehouseWriter(warehouse)
+    return BatchSink(
+        writer, max_rows=flush_rows, max_bytes=flush_bytes, max_seconds=flush_seconds, on_flush=on_flush
     )
-    logging.info(f"Uploaded {len(job_data)} jobs to BigQuery")
 
 
 def jobs_list_request(keyword, location, start=0):
@@ -91,24 +158,35 @@ def jobs_list_request(keyword, location, start=0):
         "trk": "public_jobs_jobs-search-bar_search-submit",
         "start": start,
     }
-    url = "https://www.linkedin.com/jobs-guest/jobs/api/seeMoreJobPostings/search"
+    url = f"{linkedin_url}/jobs-guest/jobs/api/seeMoreJobPostings/search"
     headers = {"User-Agent": user_agent.random}
-    return requests.get(url=url, headers=headers, params=params)
-
-
-def parse_job_list(keyword, location, page, task_id) -> list:
+    rate_limiter.wait(url)
+    try:
+        with metrics.http_request_seconds.time(stage="collect"):
+            response = session.get(url=url, headers=headers, params=params, timeout=10)
+    except requests.RequestException:
+        metrics.http_requests.inc(stage="collect", status="error")
+        raise
+    metrics.http_requests.inc(stage="collect", status=response.status_code)
+    if response.status_code == 429:
+        metrics.rate_limited.inc(stage="collect")
+        logging.warning(f"Rate limited. Pausing requests for {rate_limit_backoff} seconds...")
+        rate_limiter.penalize(url, rate_limit_backoff)
+    return response
+
+
+def parse_job_list(keyword, location, page, task_id) -> tuple[list, int]:
+    """Returns the unseen jobs on a search page and the number of cards on it."""
     job_data = []
-    soup = BeautifulSoup(page, "html.parser")
+    with metrics.parse_seconds.time(stage="collect"):
+        cards = parse_cards(page)
+    metrics.pages_parsed.inc(stage="collect")
 
-    for container in soup.find_all(attrs={"class": "job-search-card"}):
-        job_id = int(re.findall(r"\d+", container["data-entity-urn"])[0])
-        title = container.find(attrs={"class": "base-search-card__title"}).text.strip()
-        company = container.find(
-            attrs={"class": "base-search-card__subtitle"}
-        ).text.strip()
+    for card in cards:
+        job_id, title, company = card["job_id"], card["title"], card["company"]
 
         # Skip jobs from companies on the blacklist
-        if company.lower() in blacklist:
+        if company in blacklist:
             logging.info(f"Skipping job from blacklisted company: {company}")
             continue
 
@@ -126,75 +204,72 @@ def parse_job_list(keyword, location, page, task_id) -> list:
                 }
             )
 
-    return job_data
-
+    return job_data, len(cards)
 
-def process_jobs(keyword, location, task_id):
-    start = 0
-    all_job_data = []
-    while True:
-        prev = start
 
-        response = jobs_list_request(keyword=keyword, location=location, start=start)
+def process_jobs(keyword, location, task_id, sink):
+    logging.info(f"Collecting jobs - keyword: {keyword} - location: {location}")
+    pager = PaginationController(page_size, saturation_pages, max_page_retries, max_offset)
+    seen_job_ids = set()  # LinkedIn repeats cards across pages of one search
+    job_count = 0
+    while not pager.done:
+        prev = pager.start
 
-        if response.status_code != 200:
-            if start >= 900:
-                break
+        try:
+            response = jobs_list_request(keyword=keyword, location=location, start=pager.start)
+            status = response.status_code
+        except requests.RequestException as e:
+            # A timeout or dropped connection is retried like a bad status, not the end of the search
+            logging.warning(f"Request failed - keyword: {keyword} - location: {location} - {e}")
+            response = None
+            status = type(e).__name__
 
-            logging.warning("Waiting ...")
-            time.sleep(1.2)
-            response = jobs_list_request(
-                keyword=keyword, location=location, start=start
-            )
-
-        if response.status_code == 200:
-            job_data = parse_job_list(
+        if status == 200:
+            job_data, card_count = parse_job_list(
                 keyword, location, page=str(response.content, "utf-8"), task_id=task_id
             )
-            all_job_data.extend(job_data)
-
-            start += 10
+            job_data = [job for job in job_data if job["job_id"] not in seen_job_ids]
+            seen_job_ids.update(job["job_id"] for job in job_data)
+            sink.put(job_data)
+            job_count += len(job_data)
+
+            pager.page_fetched(card_count, len(job_data))
+        else:
+            delay = pager.page_failed(status)
+            if delay:
+                logging.warning(f"Waiting {delay:.1f} seconds ...")
+                time.sleep(delay)
 
         logging.info(
-            f"location: {location} status_code: {response.status_code} task_id: {task_id} page: {prev}-{start}"
+            f"location: {location} status_code: {status} task_id: {task_id} page: {prev}-{pager.start}"
         )
 
-    # Upload accumulated job data to BigQuery after processing all pages for a keyword/location combination
-    if all_job_data:
-        upload_to_bigquery(all_job_data)
-        logging.info(f"Uploaded batch of {len(all_job_data)} jobs to BigQuery")
+    logging.info(
+        f"Finished keyword: {keyword} - location: {location} - {pager.stop_reason} - {job_count} new jobs"
+    )
+
+
+def crawl(keywords, locations, max_workers=max_concurrency, on_flush=None):
+    """Run every keyword/location search on a bounded worker pool.
+
+    on_flush is called with each batch of new jobs once it is in the warehouse.
+    """
+    with create_sink(on_flush) as sink, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_search = {}
+        for keyword in keywords:
+            for location in locations:
+                task_id = uuid.uuid4().hex
+                future = executor.submit(process_jobs, keyword, location, task_id, sink)
+                future_to_search[future] = (keyword, location)
+
+        for future in as_completed(future_to_search):
+            keyword, location = future_to_search[future]
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Failed to collect jobs - keyword: {keyword} - location: {location} - {e}")
 
 
 if __name__ == "__main__":
-    keywords = [
-        "Data Scientist",
-        "ML Engineer",
-        "Data Analyst",
-        "Data Engineer",
-        "Business Analyst",
-        "Software Engineer",
-        "MLOps Engineer",
-        "AI Engineer",
-        "Decision Scientist",
-    ]
-
-    locations = [
-        "Michigan",
-        "Illinois",
-        "California",
-        "New York",
-        "Washington",
-        "Texas",
-        "Florida",
-        "Massachusetts",
-        "Wisconsin",
-        "Georgia",
-        "Washington D.C.",
-        "United States",
-    ]
-
-    for keyword in keywords:
-        for location in locations:
-            task_id = uuid.uuid4().hex
-            logging.info(f"Collecting jobs - keyword: {keyword} - location: {location}")
-            process_jobs(keyword, location, task_id)
+    metrics.start_exporter()
+    crawl(keywords, locations)
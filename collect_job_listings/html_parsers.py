@@ -0,0 +1,67 @@
+import logging
+import re
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml is optional, bs4 is always available
+    lxml_html = None
+
+# Each parser turns a search results page into one dict per job card, in page order:
+# {"job_id": int, "title": str, "company": str}
+
+
+def parse_cards_bs4(page) -> list:
+    """Reference parser: full BeautifulSoup tree with html.parser."""
+    cards = []
+    soup = BeautifulSoup(page, "html.parser")
+
+    for container in soup.find_all(attrs={"class": "job-search-card"}):
+        job_id = int(re.findall(r"\d+", container["data-entity-urn"])[0])
+        title = container.find(attrs={"class": "base-search-card__title"}).text.strip()
+        company = container.find(
+            attrs={"class": "base-search-card__subtitle"}
+        ).text.strip()
+        cards.append({"job_id": job_id, "title": title, "company": company})
+
+    return cards
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+if lxml_html is not None:
+    _cards_xpath = etree.XPath(f"//*[{_has_class('job-search-card')}]")
+    _title_xpath = etree.XPath(f".//*[{_has_class('base-search-card__title')}]")
+    _company_xpath = etree.XPath(f".//*[{_has_class('base-search-card__subtitle')}]")
+
+
+def parse_cards_lxml(page) -> list:
+    """Fast parser: libxml2 tree with precompiled XPath selectors."""
+    if not page.strip():
+        return []
+
+    cards = []
+    root = lxml_html.fromstring(page)
+
+    for container in _cards_xpath(root):
+        job_id = int(re.findall(r"\d+", container.attrib["data-entity-urn"])[0])
+        title = _title_xpath(container)[0].text_content().strip()
+        company = _company_xpath(container)[0].text_content().strip()
+        cards.append({"job_id": job_id, "title": title, "company": company})
+
+    return cards
+
+
+parsers = {"bs4": parse_cards_bs4}
+if lxml_html is not None:
+    parsers["lxml"] = parse_cards_lxml
+
+
+def get_parser(name):
+    """Returns the named parser, or the bs4 reference if it is unavailable."""
+    if name not in parsers:
+        logging.warning(f"HTML parser {name} is not available, using bs4")
+        return parse_cards_bs4
+    return parsers[name]
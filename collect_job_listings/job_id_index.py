@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+
+class JobIdIndex:
+    """Sorted int64 array of every job_id already seen, kept in a .npy file.
+
+    The array is memory-mapped instead of read into a Python set, so opening
+    it costs the same regardless of history size and a lookup is a binary
+    search. A sidecar JSON file stores the created_on watermark of the last
+    refresh; refresh() only asks the warehouse for rows newer than that.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        self.watermark = 0.0
+        self.ids = np.empty(0, dtype=np.int64)
+        self._open()
+
+    def _open(self):
+        if os.path.exists(self.path) and os.path.exists(self.meta_path):
+            self.ids = np.load(self.path, mmap_mode="r")
+            with open(self.meta_path, "r", encoding="utf-8") as file:
+                self.watermark = json.load(file)["watermark"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, job_id):
+        i = np.searchsorted(self.ids, job_id)
+        return i < len(self.ids) and self.ids[i] == job_id
+
+    def refresh(self, load_delta, overlap=86400):
+        """Merge job_ids created after the watermark into the index file.
+
+        load_delta(since) must return a DataFrame with job_id and created_on
+        columns. The overlap (seconds) re-reads rows that were uploaded late
+        with an older created_on, e.g. by a collector that was still running.
+        """
+        since = max(self.watermark - overlap, 0) if self.watermark else 0
+        df = load_delta(since)
+        if df.empty:
+            logging.info(f"Job ID index up to date with {len(self)} IDs")
+            return
+
+        new_ids = np.unique(df["job_id"].to_numpy(dtype=np.int64))
+        merged = np.union1d(self.ids, new_ids)
+        watermark = max(self.watermark, float(df["created_on"].max()))
+
+        # Write next to the old files and swap, so a crash never leaves a torn index
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, merged)
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"watermark": watermark, "count": len(merged), "updated_at": time.time()}, file)
+        os.replace(tmp_path, self.path)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+        added = len(merged) - len(self)
+        self.ids = np.load(self.path, mmap_mode="r")
+        self.watermark = watermark
+        logging.info(f"Job ID index refreshed: {added} new IDs, {len(self)} total")
@@ -0,0 +1,45 @@
+class PaginationController:
+    """Decides the next offset of a keyword/location search and when to stop.
+
+    A search stops at an empty page, after saturation_pages pages in a row
+    without a new job_id, at max_offset, or when a page still fails after
+    max_retries retries. A page with fewer than page_size cards does not end
+    it: LinkedIn returns short pages in the middle of the results too.
+    """
+
+    def __init__(self, page_size=10, saturation_pages=3, max_retries=3, max_offset=1000, retry_delay=1.2):
+        self.page_size = page_size
+        self.saturation_pages = saturation_pages
+        self.max_retries = max_retries
+        self.max_offset = max_offset
+        self.retry_delay = retry_delay
+        self.start = 0
+        self.retries = 0
+        self.stale_pages = 0  # consecutive pages without a new job_id
+        self.stop_reason = None
+
+    @property
+    def done(self):
+        return self.stop_reason is not None
+
+    def page_fetched(self, card_count, new_count):
+        """Record a 200 page with card_count cards, new_count of them unseen."""
+        self.retries = 0
+        self.stale_pages = 0 if new_count else self.stale_pages + 1
+
+        if card_count == 0:
+            self.stop_reason = "empty page"
+        elif self.stale_pages >= self.saturation_pages:
+            self.stop_reason = f"no new jobs in {self.stale_pages} pages"
+        elif self.start + self.page_size >= self.max_offset:
+            self.stop_reason = "max offset"
+
+        self.start += self.page_size
+
+    def page_failed(self, status):
+        """Record a non-200 response or a failed request; returns the delay before retrying."""
+        self.retries += 1
+        if self.retries > self.max_retries:
+            self.stop_reason = f"status {status} after {self.max_retries} retries"
+            return 0
+        return self.retry_delay * 2 ** (self.retries - 1)
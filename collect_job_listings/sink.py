@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from common import metrics
+
+_CLOSE = object()
+
+
+class WarehouseWriter:
+    """Inserts each batch into raw_data.jobs, skipping job_ids the warehouse already has.
+
+    The insert is keyed on job_id, so a retried or repeated batch never
+    duplicates a job and never overwrites one that was enriched since.
+    """
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+
+    def write(self, rows):
+        inserted = self.warehouse.insert_new_jobs(pd.DataFrame(rows))
+        logging.info(f"Uploaded {inserted} new jobs to the warehouse ({len(rows)} in batch)")
+
+
+class JsonlWriter:
+    """Appends each batch to a local JSON-lines file, for testing without a warehouse."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, rows):
+        with open(self.path, "a", encoding="utf-8") as file:
+            for row in rows:
+                file.write(json.dumps(row) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        logging.info(f"Wrote {len(rows)} jobs to {self.path}")
+
+
+class BatchSink:
+    """Bounded queue of rows that a background thread flushes to a writer.
+
+    A batch is written once it reaches max_rows rows or max_bytes of JSON,
+    or max_seconds after the last flush. put() blocks while max_pending rows
+    are waiting, so a slow writer holds back the crawl instead of memory
+    growing. close() flushes whatever is left. Rows whose key was already
+    written in this run, or is in the batch being built, are dropped, so
+    concurrent searches that find the same job write it once. on_flush, if
+    given, is called with each batch after it was written. When a batch
+    still fails after max_retries attempts it is dropped, and when on_flush
+    raises the batch is not passed on; either way the sink carries on, but
+    close() then raises the first such error.
+    """
+
+    def __init__(self, writer, max_rows=500, max_bytes=1_000_000, max_seconds=30,
+                 max_pending=10_000, max_retries=3, key="job_id", on_flush=None):
+        self.writer = writer
+        self.on_flush = on_flush
+        self.key = key
+        self.seen = set()
+        self.error = None
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.max_retries = max_retries
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.rows_written = 0
+        self.thread = threading.Thread(target=self._run, name="batch-sink", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, rows):
+        for row in rows:
+            self.queue.put(row)
+
+    def close(self):
+        self.queue.put(_CLOSE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        batch = []
+        batch_keys = set()
+        batch_bytes = 0
+        deadline = time.monotonic() + self.max_seconds
+
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            metrics.queue_depth.set(self.queue.qsize(), queue="collect_sink")
+
+            if item is _CLOSE:
+                self._flush(batch)
+                return
+
+            if item is not None and item[self.key] not in self.seen and item[self.key] not in batch_keys:
+                batch_keys.add(item[self.key])
+                batch.append(item)
+                batch_bytes += len(json.dumps(item, default=str))
+
+            if (
+                len(batch) >= self.max_rows
+                or batch_bytes >= self.max_bytes
+                or time.monotonic() >= deadline
+            ):
+                self._flush(batch)
+                batch = []
+                batch_keys = set()
+                batch_bytes = 0
+                deadline = time.monotonic() + self.max_seconds
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        for retry in range(self.max_retries):
+            try:
+                self.writer.write(batch)
+                self.rows_written += len(batch)
+            except Exception as e:
+                logging.warning(f"Failed to write batch of {len(batch)} rows (attempt {retry + 1}): {e}")
+                error = e
+                if retry + 1 < self.max_retries:
+                    time.sleep(2**retry)
+            else:
+                # Only written keys count as seen, so a job from a dropped batch can still be written later
+                self.seen.update(row[self.key] for row in batch)
+                self._notify(batch)
+                return
+        logging.error(f"Dropped batch of {len(batch)} rows after {self.max_retries} attempts")
+        self._fail(error)
+
+    def _notify(self, batch):
+        if not self.on_flush:
+            return
+        try:
+            self.on_flush(batch)
+        except Exception as e:
+            # The rows are written; keep draining the queue so put() never blocks, and let close() raise
+            logging.error(f"on_flush failed for a batch of {len(batch)} rows: {e}")
+            self._fail(e)
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
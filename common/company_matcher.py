@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import unicodedata
+from functools import lru_cache
+
+# Bump when normalize_company changes so cached blacklists are rebuilt
+normalizer_version = 2
+
+legal_suffixes = {
+    "inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation",
+    "company", "plc", "lp", "llp", "gmbh", "pllc",
+}
+# Also ordinary words or initials ("Data Co" is not "Data"), so only dropped
+# when written as a suffix: with dots ("Co.", "S.A.") or after a comma ("Data, Co")
+ambiguous_suffixes = {"co", "sa", "ag"}
+
+# Known alternate names, keyed and valued by their normalized form
+aliases = {
+    "robert half international": "robert half",
+    "robert half technology": "robert half",
+    "tek systems": "teksystems",
+}
+
+
+@lru_cache(maxsize=65536)
+def normalize_company(name):
+    """Canonical form of a company name: "Robert Half, Inc." -> "robert half"."""
+    if not isinstance(name, str):
+        return ""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    name = name.lower().replace("&", " and ")
+    # (word without dots, whether it had dots or followed a comma)
+    words = [
+        (token.replace(".", ""), bool(comma) or "." in token)
+        for comma, token in re.findall(r"(,)?[^a-z0-9,]*([a-z0-9][a-z0-9.]*)", name)
+    ]
+
+    # Drop trailing legal suffixes, but never the whole name ("The Company")
+    while len(words) > 1 and (
+        words[-1][0] in legal_suffixes or (words[-1][0] in ambiguous_suffixes and words[-1][1])
+    ):
+        words.pop()
+
+    name = " ".join(word for word, _ in words)
+    return aliases.get(name, name)
+
+
+class BlacklistMatcher:
+    """Set of normalized blacklisted company names with O(1) membership."""
+
+    def __init__(self, companies):
+        self.companies = sorted(set(companies))
+        self.index = frozenset(normalize_company(company) for company in self.companies)
+        self.index -= {""}
+        self.version = blacklist_version(self.companies)
+
+    def __contains__(self, company):
+        return normalize_company(company) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+
+def blacklist_version(companies):
+    digest = hashlib.sha256("\n".join(sorted(companies)).encode("utf-8")).hexdigest()[:16]
+    return f"{normalizer_version}-{digest}"
+
+
+def load_blacklist(fetch_companies, cache_path="state/blacklist.json", max_age=86400):
+    """Builds a BlacklistMatcher, using a local cache younger than max_age seconds.
+
+    fetch_companies() returns the blacklisted company names from the warehouse.
+    If the fetch fails, a stale cache is used rather than running without a
+    blacklist. A cache that cannot be read is ignored and rewritten.
+    """
+    cached = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as file:
+                cached = json.load(file)
+            fresh = time.time() - cached["fetched_at"] < max_age
+            version = blacklist_version(cached["companies"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable blacklist cache {cache_path}: {e}")
+            cached = None
+        else:
+            if fresh and cached["version"] == version:
+                return BlacklistMatcher(cached["companies"])
+
+    try:
+        companies = fetch_companies()
+    except Exception as e:
+        if cached is None:
+            raise
+        logging.warning(f"Failed to fetch blacklist, using cached copy: {e}")
+        return BlacklistMatcher(cached["companies"])
+
+    matcher = BlacklistMatcher(companies)
+    directory = os.path.dirname(cache_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A temp file of its own, so processes refreshing the cache at once never write into one file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump({"version": matcher.version, "fetched_at": time.time(), "companies": matcher.companies}, file)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logging.info(f"Loaded {len(matcher)} blacklisted companies (version {matcher.version})")
+    return matcher
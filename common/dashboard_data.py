@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+# Columns the extraction stores as arrays of strings
+columns_with_lists = [
+    "tech_stack",
+    "soft_skills",
+    "hard_skills",
+    "industries",
+    "benefits",
+]
+
+# Dictionary for replacements
+replacements = {
+    "PowerBI": "Power BI",
+    "401k": "401(k)",
+    "401(k) plan": "401(k)",
+    "Vision Insurance": "Vision",
+    "Dental Insurance": "Dental",
+    "Medical Insurance": "Medical",
+    "Microsoft Excel": "Excel",
+    "Microsoft Office Suite": "Microsoft Office",
+    "Microsoft Word": "Word",
+    "Tuition Assistance": "Tuition Reimbursement",
+    "PTO": "Paid Time Off",
+    "Competitive Salary": "Competitive Compensation",
+    "Paid Parental Leave": "Parental Leave",
+    "Attention to Detail": "Detail Oriented",
+    "Detail-oriented": "Detail Oriented",
+    "problem-solving": "Problem Solving",
+    "analytical thinking": "Analytical",
+    "analytical skills": "Analytical",
+    "Presentation": "Presentation Skills",
+    "apache spark": "Spark",
+    "apache kafka": "Kafka",
+    "apache hadoop": "Hadoop",
+    "apache airflow": "Airflow",
+    "azure databricks": "Databricks",
+    "google cloud platform": "GCP",
+    "amazon web services": "AWS",
+    "aws services": "AWS",
+    "interpersonal skills": "interpersonal",
+}
+
+# Columns the replacements apply to
+columns_to_replace = [
+    "tech_stack",
+    "hard_skills",
+    "soft_skills",
+    "industries",
+    "company",
+    "benefits",
+]
+
+# The dashboard's "every keyword" option, stored as a keyword of its own in the aggregates
+all_keywords = "All Data Related Jobs"
+
+# Columns charted per keyword, and per keyword and company
+chart_columns = ["tech_stack", "hard_skills", "soft_skills", "industries", "company", "benefits"]
+company_chart_columns = ["tech_stack", "hard_skills", "soft_skills", "industries", "benefits"]
+
+# Terms kept per chart in the aggregates; the sliders go up to 200 companies and 50 terms
+max_terms = 200
+max_company_terms = 50
+
+
+# The warehouse returns arrays as lists or numpy arrays, and missing ones as null
+def convert_arrays_to_lists(df, column_name):
+    df[column_name] = df[column_name].apply(
+        lambda x: list(set(x)) if isinstance(x, (list, np.ndarray)) else []
+    )
+    return df
+
+
+# Function to replace words in lists
+def replace_words_in_list(data, column_name, replacements):
+    # lowercase all replacements
+    replacements = {
+        key.lower(): value.lower() for key, value in replacements.items()
+    }
+
+    for i, items in data[column_name].items():
+
+        # lowercase all items
+        if isinstance(items, list):
+            items = [item.lower() for item in items if isinstance(item, str)]
+
+        if isinstance(items, list):
+            data.at[i, column_name] = [
+                replacements.get(item, item) for item in items
+            ]
+        elif isinstance(items, str):
+            data.at[i, column_name] = replacements.get(items, items)
+
+
+def prepare_jobs(data, blacklist):
+    """Turn the extracted jobs into what the dashboard charts.
+
+    Returns the jobs that are not from a blacklisted company and how many
+    were excluded.
+    """
+    data = data.dropna(subset=["summary"])
+
+    for column in columns_with_lists:
+        data = convert_arrays_to_lists(data, column)
+
+    data["salary"] = data["salary"].apply(lambda x: x if isinstance(x, dict) else {})
+
+    for column in columns_to_replace:
+        if column in data.columns:
+            replace_words_in_list(data, column, replacements)
+
+    # Blacklist of companies, matched on normalized names ("Robert Half Inc" -> "robert half")
+    is_blacklisted = data["company"].map(lambda company: company in blacklist)
+
+    # Convert company names to lowercase for display
+    data["company"] = data["company"].str.lower()
+
+    return data[~is_blacklisted], int(is_blacklisted.sum())
+
+
+# Function to calculate median min and max salary
+def calculate_mean_salary(data):
+    min_salaries = [
+        entry["min"]
+        for entry in data
+        if isinstance(entry, dict)
+        and "min" in entry
+        and entry["min"] is not None
+        and entry["min"] >= 20000
+    ]
+    max_salaries = [
+        entry["max"]
+        for entry in data
+        if isinstance(entry, dict)
+        and "max" in entry
+        and entry["max"] is not None
+        and entry["max"] >= 20000
+    ]
+
+    min_salary = np.mean(min_salaries) if min_salaries else 0
+    max_salary = np.mean(max_salaries) if max_salaries else 0
+
+    return min_salary, max_salary
+
+
+def _count_terms(data, group_columns, columns, limit):
+    """jobs per term of each column, case-insensitive and without empty terms, the top limit per group and column."""
+    counts = []
+    for column in columns:
+        terms = data[group_columns + [column]].explode(column)
+        terms = terms[terms[column].map(lambda term: isinstance(term, str) and term != "")]
+        terms[column] = terms[column].str.lower()
+        counted = terms.groupby(group_columns + [column]).size().reset_index(name="jobs")
+        counted = counted.rename(columns={column: "term"}).sort_values(["jobs", "term"], ascending=[False, True])
+        counted = counted.groupby(group_columns).head(limit)
+        counted.insert(len(group_columns), "category", column)
+        counts.append(counted)
+    return pd.concat(counts, ignore_index=True)
+
+
+def _with_all_keywords(data):
+    """data, plus every row again under the all_keywords keyword."""
+    return pd.concat([data, data.assign(keyword=all_keywords)], ignore_index=True)
+
+
+def term_counts(data):
+    """keyword, category, term, jobs for the prepared jobs, for the keyword charts."""
+    return _count_terms(_with_all_keywords(data), ["keyword"], chart_columns, max_terms)
+
+
+def company_term_counts(data):
+    """keyword, company, category, term, jobs for the prepared jobs, for the company charts."""
+    return _count_terms(_with_all_keywords(data), ["keyword", "company"], company_chart_columns, max_company_terms)
+
+
+def salary_summary(data):
+    """keyword, mean min and max salary, jobs and the oldest and newest extraction time, per keyword."""
+    rows = []
+    for keyword, jobs in _with_all_keywords(data).groupby("keyword", sort=False):
+        min_salary, max_salary = calculate_mean_salary(jobs["salary"].tolist())
+        rows.append({
+            "keyword": keyword,
+            "min_salary": float(min_salary),
+            "max_salary": float(max_salary),
+            "jobs": len(jobs),
+            "oldest": jobs["time_extracted"].min(),
+            "newest": jobs["time_extracted"].max(),
+        })
+    return pd.DataFrame(rows, columns=["keyword", "min_salary", "max_salary", "jobs", "oldest", "newest"])
+
+
+def top_terms(counts, column_name, n):
+    """The n most common terms of a category in term counts, as a column_name, Frequency table for the charts."""
+    counts = counts[counts["category"] == column_name].sort_values(["jobs", "term"], ascending=[False, True])
+    return counts.head(n).rename(columns={"term": column_name, "jobs": "Frequency"})[[column_name, "Frequency"]]
@@ -0,0 +1,26 @@
+import hashlib
+import re
+
+# The same normalization in BigQuery SQL, for rows written before the
+# description_hash column existed. Keep all three in sync.
+normalized_description_sql = "TRIM(REGEXP_REPLACE(LOWER({column}), r'[^a-z0-9]+', ' '))"
+description_hash_sql = f"TO_HEX(SHA256(NULLIF({normalized_description_sql}, '')))"
+
+# DuckDB replaces only the first match unless given the 'g' flag, and its sha256 is already hex
+duckdb_normalized_description_sql = "TRIM(REGEXP_REPLACE(LOWER({column}), '[^a-z0-9]+', ' ', 'g'))"
+duckdb_description_hash_sql = f"SHA256(NULLIF({duckdb_normalized_description_sql}, ''))"
+
+
+def normalize_description(text):
+    """Lowercase, with every run of non-alphanumeric characters folded into one space."""
+    if not isinstance(text, str):
+        return ""
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def description_fingerprint(text):
+    """Hex sha256 of the normalized description, or None for an empty one."""
+    normalized = normalize_description(text)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
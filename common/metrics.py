@@ -0,0 +1,185 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {}  # sorted (label, value) tuples -> value
+        registry.append(self)
+
+    def _key(self, labels):
+        # Label values are strings in the exposition format, and the same label can be given an int
+        # (a status code) or a str ("error"), which would not sort together
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=default_buckets):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+registry = []
+
+# Every stage records into these; the stage label says which one
+http_requests = Counter("techlist_http_requests_total", "HTTP requests to LinkedIn by stage and status code")
+http_request_seconds = Histogram("techlist_http_request_seconds", "HTTP request latency by stage")
+pages_parsed = Counter("techlist_pages_parsed_total", "Search and job pages parsed by stage")
+parse_seconds = Histogram("techlist_parse_seconds", "Time to parse one page by stage")
+rate_limited = Counter("techlist_rate_limited_total", "Pauses caused by HTTP 429 by stage")
+concurrency_limit = Gauge("techlist_concurrency_limit", "Current adaptive limit on requests in flight")
+in_flight = Gauge("techlist_requests_in_flight", "Requests in flight")
+queue_depth = Gauge("techlist_queue_depth", "Items waiting in a queue")
+stage_items = Counter("techlist_stage_items_total", "Items handled by a pipeline stage by outcome")
+gemini_request_seconds = Histogram("techlist_gemini_request_seconds", "Gemini generate_content latency")
+gemini_tokens = Counter("techlist_gemini_tokens_total", "Gemini tokens used by kind (prompt, output)")
+gemini_requests = Counter("techlist_gemini_requests_total", "Gemini calls by outcome")
+boilerplate_tokens_saved = Counter(
+    "techlist_boilerplate_tokens_saved_total", "Estimated prompt tokens saved by stripping boilerplate"
+)
+batch_prediction_requests = Counter(
+    "techlist_batch_prediction_requests_total", "Batch prediction request lines by outcome"
+)
+extraction_cache = Counter("techlist_extraction_cache_total", "Jobs looked up in the extraction cache by result")
+warehouse_seconds = Histogram("techlist_warehouse_seconds", "Warehouse statement and load time by operation")
+warehouse_rows_written = Counter("techlist_warehouse_rows_written_total", "Rows written to the warehouse by table")
+warehouse_bytes_written = Counter("techlist_warehouse_bytes_written_total", "Bytes sent to the warehouse by table")
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+def write_textfile(path):
+    """Write the metrics for node_exporter's textfile collector, replacing the file atomically."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(render())
+    os.replace(path + ".tmp", path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_started = False
+
+
+def start_exporter():
+    """Expose metrics as configured by the environment; does nothing if neither is set.
+
+    METRICS_PORT serves /metrics over HTTP for Prometheus or a port-forward.
+    METRICS_TEXTFILE is rewritten every METRICS_TEXTFILE_SECONDS and at exit,
+    so the numbers of a finished run are still there afterwards.
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+
+    port = os.getenv("METRICS_PORT")
+    if port:
+        server = ThreadingHTTPServer(("", int(port)), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Serving metrics on port {port}")
+
+    path = os.getenv("METRICS_TEXTFILE")
+    if path:
+        interval = float(os.getenv("METRICS_TEXTFILE_SECONDS", "15"))
+
+        def write_periodically():
+            while True:
+                time.sleep(interval)
+                try:
+                    write_textfile(path)
+                except Exception as e:
+                    logging.warning(f"Failed to write metrics to {path}: {e}")
+
+        threading.Thread(target=write_periodically, name="metrics-textfile", daemon=True).start()
+        atexit.register(write_textfile, path)
+        logging.info(f"Writing metrics to {path} every {interval} seconds")
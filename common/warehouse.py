@@ -0,0 +1,977 @@
+import argparse
+import functools
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from common import metrics
+from common.fingerprint import description_hash_sql, duckdb_description_hash_sql
+
+raw_jobs = "raw_data.jobs"
+extracted_jobs = "extracted_data.jobs"
+bad_jobs = "raw_data.bad_jobs"
+blacklist = "extracted_data.blacklist"
+dedup_watermarks = "raw_data.dedup_watermarks"
+term_counts = "extracted_data.term_counts"
+company_term_counts = "extracted_data.company_term_counts"
+salary_summary = "extracted_data.salary_summary"
+
+raw_columns = ["task_id", "keyword", "location", "job_id", "company", "title", "created_on",
+               "description", "description_hash", "url"]
+extracted_columns = raw_columns + ["summary", "industries", "soft_skills", "hard_skills", "tech_stack",
+                                   "programming_languages", "education", "salary", "benefits"]
+# Extracted fields stored as arrays of strings, and as structs
+list_columns = ["industries", "soft_skills", "hard_skills", "tech_stack", "programming_languages", "benefits"]
+struct_columns = ["salary", "education"]
+dashboard_columns = ["keyword", "company", "title", "summary", "url", "hard_skills", "tech_stack",
+                     "soft_skills", "industries", "benefits", "salary"]
+
+
+def timed(operation):
+    """Record how long each call of a warehouse method takes, by operation and backend."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with metrics.warehouse_seconds.time(operation=operation, backend=self.backend):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_write(name, df=None, paths=()):
+    """Count the rows and bytes sent to a table, from a DataFrame or from Parquet files."""
+    if df is not None:
+        metrics.warehouse_rows_written.inc(len(df), table=name)
+        metrics.warehouse_bytes_written.inc(int(df.memory_usage(deep=True).sum()), table=name)
+    for path in paths:
+        metrics.warehouse_bytes_written.inc(os.path.getsize(path), table=name)
+
+
+class Warehouse:
+    """Every read and write the pipeline stages and the dashboard make.
+
+    The operations are written once in SQL that BigQuery and DuckDB both
+    accept. Subclasses run it (query, execute, replace_table), load
+    DataFrames (append, insert_new_jobs, merge_descriptions) and fill in
+    the few dialect differences.
+    """
+
+    hash_sql = description_hash_sql
+    float_type = "FLOAT64"
+    string_types = {"STRING"}
+    string_array_type = "ARRAY<STRING>"
+
+    # Parse the comma-joined lists and JSON objects that extracted rows used to be stored as
+    split_sql = "ARRAY(SELECT term FROM UNNEST(SPLIT({column}, ',')) term WHERE term != '')"
+    struct_sql = {
+        "salary": """
+            STRUCT(SAFE_CAST(JSON_VALUE(salary, '$.min') AS FLOAT64) AS min,
+                   SAFE_CAST(JSON_VALUE(salary, '$.max') AS FLOAT64) AS max)
+            """,
+        "education": """
+            STRUCT(JSON_VALUE(education, '$.min_degree') AS min_degree,
+                   ARRAY(SELECT JSON_VALUE(field) FROM UNNEST(JSON_QUERY_ARRAY(education, '$.fields')) field) AS fields)
+            """,
+    }
+
+    def table(self, name):
+        return name
+
+    def query(self, sql):
+        raise NotImplementedError
+
+    def execute(self, sql, table):
+        """Run a DML statement that writes table and return the number of rows it changed."""
+        raise NotImplementedError
+
+    def replace_table(self, name, select_sql):
+        raise NotImplementedError
+
+    def append(self, name, df):
+        raise NotImplementedError
+
+    def overwrite(self, name, df):
+        """Replace a table's rows and columns with a DataFrame."""
+        raise NotImplementedError
+
+    def quote(self, value):
+        """A string literal for value."""
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+    def insert_new_jobs(self, df):
+        """Insert collected jobs into raw_data.jobs, skipping job_ids it already has."""
+        raise NotImplementedError
+
+    def merge_descriptions(self, paths, insert_missing=True):
+        """Upsert the enriched rows in the given Parquet files into raw_data.jobs on job_id.
+
+        With insert_missing=False rows are only updated, so a job deleted from
+        raw_data.jobs since it was staged (extracted, or moved to bad_jobs) stays deleted.
+        """
+        raise NotImplementedError
+
+    def column_types(self, name):
+        """column name -> SQL type of a table's columns."""
+        raise NotImplementedError
+
+    def count(self, name):
+        return int(self.query(f"SELECT COUNT(*) AS count FROM {self.table(name)}")["count"].iloc[0])
+
+    # Collection
+
+    def blacklist_companies(self):
+        return self.query(f"SELECT company FROM {self.table(blacklist)}")["company"].tolist()
+
+    def job_ids_since(self, created_on):
+        """job_ids from every stage's table that were written after created_on."""
+        return self.query(
+            f"""
+            SELECT job_id, MAX(created_on) AS created_on
+            FROM (
+                SELECT job_id, created_on FROM {self.table(raw_jobs)}
+                UNION ALL
+                SELECT job_id, created_on FROM {self.table(extracted_jobs)}
+                UNION ALL
+                SELECT job_id, created_on FROM {self.table(bad_jobs)}
+            )
+            WHERE created_on > {created_on}
+            GROUP BY job_id
+            """
+        )
+
+    def has_duplicate_job_ids(self):
+        df = self.query(
+            f"""
+            SELECT EXISTS (
+                SELECT job_id
+                FROM {self.table(raw_jobs)}
+                GROUP BY job_id
+                HAVING COUNT(*) > 1
+            ) AS has_duplicates
+            """
+        )
+        return bool(df["has_duplicates"].iloc[0])
+
+    def deduplicate_job_ids(self):
+        """Keep the newest row of each job_id in raw_data.jobs, with every column."""
+        self.replace_table(
+            raw_jobs,
+            f"""
+            SELECT *
+            FROM {self.table(raw_jobs)}
+            WHERE TRUE
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY created_on DESC) = 1
+            """,
+        )
+
+    # Enrichment
+
+    def description_hashes(self, name):
+        df = self.query(f"SELECT DISTINCT description_hash FROM {self.table(name)} WHERE description_hash IS NOT NULL")
+        return df["description_hash"].tolist()
+
+    def jobs_without_description(self):
+        df = self.query(
+            f"""
+            SELECT job_id FROM {self.table(raw_jobs)}
+            WHERE description IS NULL
+            ORDER BY created_on
+            """
+        )
+        return df["job_id"].tolist()
+
+    def raw_job_ids(self):
+        df = self.query(f"SELECT job_id FROM {self.table(raw_jobs)}")
+        return df["job_id"].tolist()
+
+    # Description deduplication
+
+    def get_watermarks(self):
+        self.query(
+            f"CREATE TABLE IF NOT EXISTS {self.table(dedup_watermarks)} "
+            f"(name STRING, watermark {self.float_type}, updated_at TIMESTAMP)"
+        )
+        df = self.query(f"SELECT name, watermark FROM {self.table(dedup_watermarks)}")
+        return dict(zip(df["name"], df["watermark"]))
+
+    def set_watermark(self, name, watermark):
+        self.execute(f"DELETE FROM {self.table(dedup_watermarks)} WHERE name = '{name}'", dedup_watermarks)
+        self.execute(
+            f"INSERT INTO {self.table(dedup_watermarks)} (name, watermark, updated_at) "
+            f"VALUES ('{name}', {float(watermark)!r}, CURRENT_TIMESTAMP)",
+            dedup_watermarks,
+        )
+
+    def max_created_on(self, name):
+        df = self.query(f"SELECT MAX(created_on) AS created_on FROM {self.table(name)}")
+        value = df["created_on"].iloc[0]
+        return 0.0 if pd.isna(value) else float(value)
+
+    def ensure_description_hash_columns(self):
+        """Add description_hash to the tables jobs are written to with it, if they predate the column.
+
+        Extraction reads it from raw_data.jobs and writes it to
+        extracted_data.jobs or, for a job that fails, raw_data.bad_jobs.
+        """
+        for name in [raw_jobs, extracted_jobs, bad_jobs]:
+            self.execute(f"ALTER TABLE {self.table(name)} ADD COLUMN IF NOT EXISTS description_hash STRING", name)
+
+    def backfill_description_hashes(self, since=0.0):
+        """Add description_hash to the job tables and fill it for rows written before enrichment set it."""
+        self.ensure_description_hash_columns()
+        backfilled = {}
+        for name in [raw_jobs, extracted_jobs]:
+            backfilled[name] = self.execute(
+                f"""
+                UPDATE {self.table(name)}
+                SET description_hash = {self.hash_sql.format(column="description")}
+                WHERE description_hash IS NULL AND description IS NOT NULL AND description != ''
+                  AND created_on > {since}
+                """,
+                name,
+            )
+        return backfilled
+
+    def _rewrite(self, name, select_sql):
+        before = self.count(name)
+        self.replace_table(name, select_sql)
+        return before, self.count(name)
+
+    def compact_raw_jobs(self):
+        """Keep the newest raw row per description and drop the ones already extracted; (before, after) counts."""
+        return self._rewrite(
+            raw_jobs,
+            f"""
+            SELECT j.*
+            FROM (
+              SELECT *
+              FROM {self.table(raw_jobs)}
+              WHERE TRUE
+              QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY IFNULL(description_hash, CONCAT(CAST(job_id AS STRING), '_null'))
+                ORDER BY created_on DESC
+              ) = 1
+            ) j
+            LEFT JOIN (SELECT DISTINCT job_id FROM {self.table(extracted_jobs)}) e
+              ON j.job_id = e.job_id
+            WHERE e.job_id IS NULL
+            """,
+        )
+
+    def compact_extracted_jobs(self):
+        """Keep the newest extracted row per job_id and per description; (before, after) counts."""
+        return self._rewrite(
+            extracted_jobs,
+            f"""
+            SELECT *
+            FROM {self.table(extracted_jobs)}
+            WHERE TRUE
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY created_on DESC) = 1
+              AND ROW_NUMBER() OVER (
+                PARTITION BY IFNULL(description_hash, CAST(job_id AS STRING))
+                ORDER BY created_on DESC
+              ) = 1
+            """,
+        )
+
+    def remove_processed_jobs(self):
+        """Drop raw rows whose job_id was extracted; (before, after) counts."""
+        return self._rewrite(
+            raw_jobs,
+            f"""
+            SELECT r.*
+            FROM {self.table(raw_jobs)} r
+            LEFT JOIN (SELECT DISTINCT job_id FROM {self.table(extracted_jobs)}) e
+            ON r.job_id = e.job_id
+            WHERE e.job_id IS NULL
+            """,
+        )
+
+    def delete_rows(self, name, rows_sql, keep_one_sql=None):
+        """Delete the (job_id, created_on) rows selected by rows_sql from a table.
+
+        Rows are matched on (job_id, created_on), so every copy of a selected
+        key goes. For the keys keep_one_sql selects (a subset of rows_sql),
+        one copy is put back afterwards, which collapses exact duplicates of a
+        row that is kept. Returns the number of rows removed.
+        """
+        restore_name = f"{name}_restore_{uuid.uuid4().hex[:8]}"
+        if keep_one_sql:
+            self.query(
+                f"""
+                CREATE TABLE {self.table(restore_name)} AS
+                SELECT T.* FROM {self.table(name)} T
+                WHERE EXISTS (
+                  SELECT 1 FROM ({keep_one_sql}) K
+                  WHERE K.job_id = T.job_id AND K.created_on = T.created_on
+                )
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY T.job_id, T.created_on) = 1
+                """
+            )
+        try:
+            deleted = self.execute(
+                f"""
+                DELETE FROM {self.table(name)} T
+                WHERE EXISTS (
+                  SELECT 1 FROM ({rows_sql}) L
+                  WHERE L.job_id = T.job_id AND L.created_on = T.created_on
+                )
+                """,
+                name,
+            )
+            if keep_one_sql:
+                deleted -= self.execute(
+                    f"INSERT INTO {self.table(name)} SELECT * FROM {self.table(restore_name)}", name
+                )
+        finally:
+            if keep_one_sql:
+                self.query(f"DROP TABLE IF EXISTS {self.table(restore_name)}")
+        return deleted
+
+    def deduplicate_incremental(self, raw_since, extracted_since):
+        """Incremental versions of the three compactions, touching only rows after the watermarks.
+
+        Only description_hash groups that gained a row since raw_since are ranked,
+        and only their older rows are deleted. The same goes for extracted rows
+        after extracted_since. Raw rows whose job_id was extracted after
+        extracted_since are removed. A job_id that still wins its group is never
+        deleted, even if another row of it lost, and exact copies of a kept
+        extracted row are collapsed to one. Returns the rows removed by each
+        of the three steps.
+        """
+        raw_table = self.table(raw_jobs)
+        extracted_table = self.table(extracted_jobs)
+
+        raw_losers = f"""
+        WITH touched AS (
+          SELECT DISTINCT description_hash FROM {raw_table}
+          WHERE created_on > {raw_since} AND description_hash IS NOT NULL
+        ),
+        ranked AS (
+          SELECT r.job_id, r.created_on,
+                 ROW_NUMBER() OVER (PARTITION BY r.description_hash ORDER BY r.created_on DESC) AS row_num
+          FROM {raw_table} r JOIN touched USING (description_hash)
+        )
+        SELECT job_id, created_on FROM ranked
+        WHERE row_num > 1 AND job_id NOT IN (SELECT job_id FROM ranked WHERE row_num = 1)
+        """
+
+        # Rows are deleted by (job_id, created_on), so they are ranked once per
+        # key: two copies of a job with the same created_on rank as one row,
+        # and the key either loses or is kept with a single copy
+        extracted_ranked = f"""
+        WITH touched AS (
+          SELECT job_id, description_hash FROM {extracted_table}
+          WHERE created_on > {extracted_since}
+        ),
+        keyed AS (
+          SELECT e.job_id, e.created_on, e.description_hash,
+                 COUNT(*) OVER (PARTITION BY e.job_id, e.created_on) AS copies
+          FROM {extracted_table} e
+          WHERE e.job_id IN (SELECT job_id FROM touched)
+             OR e.description_hash IN (SELECT description_hash FROM touched WHERE description_hash IS NOT NULL)
+          QUALIFY ROW_NUMBER() OVER (PARTITION BY e.job_id, e.created_on) = 1
+        ),
+        ranked AS (
+          SELECT job_id, created_on, copies,
+                 ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY created_on DESC) AS job_id_rank,
+                 ROW_NUMBER() OVER (
+                   PARTITION BY IFNULL(description_hash, CAST(job_id AS STRING))
+                   ORDER BY created_on DESC
+                 ) AS description_rank
+          FROM keyed
+        )
+        """
+        extracted_losers = f"""
+        {extracted_ranked}
+        SELECT job_id, created_on FROM ranked
+        WHERE job_id_rank > 1 OR description_rank > 1 OR copies > 1
+        """
+        extracted_duplicated_winners = f"""
+        {extracted_ranked}
+        SELECT job_id, created_on FROM ranked
+        WHERE job_id_rank = 1 AND description_rank = 1 AND copies > 1
+        """
+
+        processed = f"""
+        SELECT r.job_id, r.created_on FROM {raw_table} r
+        WHERE r.job_id IN (SELECT job_id FROM {extracted_table} WHERE created_on > {extracted_since})
+        """
+
+        return (
+            self.delete_rows(raw_jobs, raw_losers),
+            self.delete_rows(extracted_jobs, extracted_losers, keep_one_sql=extracted_duplicated_winners),
+            self.delete_rows(raw_jobs, processed),
+        )
+
+    def near_duplicate_candidates(self, lookback_seconds):
+        """Pending raw jobs with a description, and jobs extracted within lookback_seconds."""
+        pending = self.query(
+            f"""
+            SELECT r.job_id, r.description, r.created_on
+            FROM {self.table(raw_jobs)} r
+            LEFT JOIN {self.table(extracted_jobs)} e
+              ON r.job_id = e.job_id
+            WHERE e.job_id IS NULL AND r.description IS NOT NULL AND r.description != ''
+            """
+        )
+        extracted = self.query(
+            f"""
+            SELECT job_id, description, created_on
+            FROM {self.table(extracted_jobs)}
+            WHERE created_on >= {time.time() - lookback_seconds}
+              AND description IS NOT NULL
+            """
+        )
+        return pending, extracted
+
+    def delete_jobs(self, name, job_ids, chunk_size=10_000):
+        deleted = 0
+        job_ids = sorted(int(job_id) for job_id in job_ids)
+        for i in range(0, len(job_ids), chunk_size):
+            job_ids_str = ", ".join(str(job_id) for job_id in job_ids[i:i + chunk_size])
+            deleted += self.execute(f"DELETE FROM {self.table(name)} WHERE job_id IN ({job_ids_str})", name)
+        return deleted
+
+    # Extraction
+
+    def description_corpus(self, limit):
+        """company, description_hash, description and the extracted terms of the newest limit jobs.
+
+        Raw jobs that are still waiting have no extracted terms.
+        """
+        return self.query(
+            f"""
+            SELECT company, description_hash, description, tech_stack, programming_languages
+            FROM (
+              SELECT company, description_hash, description, created_on,
+                     CAST(NULL AS {self.string_array_type}) AS tech_stack,
+                     CAST(NULL AS {self.string_array_type}) AS programming_languages
+              FROM {self.table(raw_jobs)}
+              WHERE description IS NOT NULL AND description != ''
+              UNION ALL
+              SELECT company, description_hash, description, created_on, tech_stack, programming_languages
+              FROM {self.table(extracted_jobs)}
+              WHERE description IS NOT NULL AND description != ''
+            )
+            ORDER BY created_on DESC
+            LIMIT {int(limit)}
+            """
+        )
+
+    def _remaining_jobs_sql(self, limit=""):
+        return f"""
+            SELECT r.job_id, r.description, r.description_hash, r.task_id, r.keyword, r.location,
+                   r.company, r.title, r.created_on, r.url
+            FROM {self.table(raw_jobs)} r
+            LEFT JOIN {self.table(extracted_jobs)} e ON r.job_id = e.job_id
+            LEFT JOIN {self.table(bad_jobs)} b ON r.job_id = b.job_id
+            WHERE e.job_id IS NULL AND b.job_id IS NULL
+              AND r.description IS NOT NULL AND r.description != ''
+            ORDER BY r.created_on, r.job_id
+            {limit}
+            """
+
+    def remaining_jobs(self, batch_size):
+        """The oldest raw jobs with a description that were neither extracted nor marked bad."""
+        df = self.query(self._remaining_jobs_sql(f"LIMIT {batch_size}"))
+        df["job_id"] = df["job_id"].astype(int)  # Ensure job_id is treated as an integer
+        return df
+
+    def stream_query(self, sql, batch_size):
+        """The result of one query, as DataFrames of batch_size rows."""
+        df = self.query(sql)
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size].reset_index(drop=True)
+
+    def iter_remaining_jobs(self, batch_size):
+        """Every remaining job, oldest first, batch_size at a time, from a single anti-join.
+
+        The pending set is what it was when the scan ran; jobs added or
+        extracted while the batches are being consumed do not change it.
+        """
+        for df in self.stream_query(self._remaining_jobs_sql(), batch_size):
+            df["job_id"] = df["job_id"].astype(int)
+            yield df
+
+    def parse_nested_sql(self, source, types):
+        """SELECT from source with every list or struct column that types has as a string parsed."""
+        replacements = [
+            f"{self.split_sql.format(column=column)} AS {column}"
+            for column in list_columns
+            if types.get(column) in self.string_types
+        ] + [
+            f"{self.struct_sql[column]} AS {column}"
+            for column in struct_columns
+            if types.get(column) in self.string_types
+        ]
+        if not replacements:
+            return f"SELECT * FROM {source}"
+        return f"SELECT * REPLACE ({', '.join(replacements)}) FROM {source}"
+
+    def migrate_nested_columns(self):
+        """Rewrite extracted_data.jobs with array and struct columns, if it still has the old strings.
+
+        Rows used to store lists comma-joined and salary and education as
+        JSON text. Returns the rows rewritten, 0 once the table is migrated.
+        """
+        types = self.column_types(extracted_jobs)
+        if not any(types.get(column) in self.string_types for column in list_columns + struct_columns):
+            return 0
+        self.replace_table(extracted_jobs, self.parse_nested_sql(self.table(extracted_jobs), types))
+        return self.count(extracted_jobs)
+
+    # Dashboard
+
+    def dashboard_jobs(self, keyword=None, company=None, limit=None):
+        """Extracted jobs for the dashboard, oldest first; the newest limit of them for one keyword or company."""
+        filters = ["TRUE"]
+        if keyword is not None:
+            filters.append(f"keyword = {self.quote(keyword)}")
+        if company is not None:
+            filters.append(f"LOWER(company) = {self.quote(company.lower())}")
+        df = self.query(
+            f"""
+            SELECT * FROM (
+              SELECT created_on, {", ".join(dashboard_columns)}
+              FROM {self.table(extracted_jobs)}
+              WHERE {" AND ".join(filters)}
+              ORDER BY created_on DESC
+              {f"LIMIT {int(limit)}" if limit else ""}
+            )
+            ORDER BY created_on
+            """
+        )
+        time_extracted = pd.to_datetime(df.pop("created_on"), unit="s", utc=True)
+        df.insert(0, "time_extracted", time_extracted.dt.tz_convert("America/New_York").dt.strftime("%Y-%m-%d %H:%M:%S"))
+        return df
+
+    def dashboard_term_counts(self):
+        return self.query(f"SELECT * FROM {self.table(term_counts)}")
+
+    def dashboard_salaries(self):
+        return self.query(f"SELECT * FROM {self.table(salary_summary)}")
+
+    def dashboard_company_term_counts(self, keyword, company):
+        return self.query(
+            f"""
+            SELECT category, term, jobs
+            FROM {self.table(company_term_counts)}
+            WHERE keyword = {self.quote(keyword)} AND company = {self.quote(company)}
+            """
+        )
+
+
+class BigQueryWarehouse(Warehouse):
+    """The production warehouse: the techlistme BigQuery project."""
+
+    backend = "bigquery"
+
+    def __init__(self, credentials_path="keys/gbq.json", project_id="techlistme"):
+        from google.cloud import bigquery
+        from google.oauth2 import service_account
+
+        self.project_id = project_id
+        self.credentials = service_account.Credentials.from_service_account_file(credentials_path)
+        self.client = bigquery.Client(credentials=self.credentials, project=project_id)
+        self.description_hash_added = False
+
+    def table(self, name):
+        return f"`{self.project_id}.{name}`"
+
+    @timed("query")
+    def query(self, sql):
+        return self.client.query(sql).to_dataframe()
+
+    def column_types(self, name):
+        dataset, table = name.split(".")
+        df = self.query(
+            f"""
+            SELECT column_name, data_type
+            FROM `{self.project_id}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+            WHERE table_name = '{table}'
+            """
+        )
+        return dict(zip(df["column_name"], df["data_type"]))
+
+    def stream_query(self, sql, batch_size):
+        """Pages of the query result as they arrive, through the Storage Read API when it is installed."""
+        try:
+            from google.cloud import bigquery_storage
+
+            read_client = bigquery_storage.BigQueryReadClient(credentials=self.credentials)
+        except ImportError:
+            read_client = None  # REST pages of batch_size rows instead
+
+        rows = self.client.query(sql).result(page_size=batch_size)
+        pending = None
+        for page in rows.to_dataframe_iterable(bqstorage_client=read_client):
+            pending = page if pending is None else pd.concat([pending, page], ignore_index=True)
+            while len(pending) >= batch_size:
+                yield pending.iloc[:batch_size].reset_index(drop=True)
+                pending = pending.iloc[batch_size:]
+        if pending is not None and len(pending):
+            yield pending.reset_index(drop=True)
+
+    @timed("dml")
+    def execute(self, sql, table):
+        job = self.client.query(sql)
+        job.result()
+        return job.num_dml_affected_rows or 0
+
+    @timed("replace")
+    def replace_table(self, name, select_sql):
+        self.client.query(f"CREATE OR REPLACE TABLE {self.table(name)} CLUSTER BY job_id AS {select_sql}").result()
+
+    @timed("append")
+    def append(self, name, df):
+        import pandas_gbq
+        from google.cloud import bigquery
+
+        record_write(name, df)
+        if name != extracted_jobs:
+            pandas_gbq.to_gbq(df, name, self.project_id, if_exists="append", credentials=self.credentials)
+            return
+
+        # Loaded with the table's own schema, so lists and dicts become REPEATED and STRUCT fields
+        table_id = f"{self.project_id}.{name}"
+        schema = [field for field in self.client.get_table(table_id).schema if field.name in df.columns]
+        job_config = bigquery.LoadJobConfig(schema=schema, write_disposition="WRITE_APPEND")
+        self.client.load_table_from_dataframe(df, table_id, job_config=job_config).result()
+
+    @timed("replace")
+    def overwrite(self, name, df):
+        import pandas_gbq
+
+        record_write(name, df)
+        pandas_gbq.to_gbq(df, name, self.project_id, if_exists="replace", credentials=self.credentials)
+
+    @timed("insert")
+    def insert_new_jobs(self, df):
+        """Loads the batch into a staging table and MERGEs it on job_id with insert-only semantics,
+        so a retried or repeated batch never duplicates a job and never overwrites one that was
+        enriched since."""
+        import pandas_gbq
+
+        df = df.drop_duplicates("job_id", keep="last")
+        record_write(raw_jobs, df)
+        staging_table_id = f"{raw_jobs}_ingest_{uuid.uuid4().hex[:8]}"
+        pandas_gbq.to_gbq(df, staging_table_id, self.project_id, if_exists="replace", credentials=self.credentials)
+
+        columns = ", ".join(df.columns)
+        values = ", ".join(f"S.{column}" for column in df.columns)
+        merge_query = f"""
+        MERGE {self.table(raw_jobs)} T
+        USING {self.table(staging_table_id)} S
+        ON T.job_id = S.job_id
+        WHEN NOT MATCHED THEN
+          INSERT ({columns}) VALUES ({values})
+        """
+        try:
+            # Run here rather than through execute(), which would time the MERGE a second time as "dml"
+            job = self.client.query(merge_query)
+            job.result()
+            return job.num_dml_affected_rows or 0
+        finally:
+            self.client.delete_table(f"{self.project_id}.{staging_table_id}", not_found_ok=True)
+
+    @timed("merge")
+    def merge_descriptions(self, paths, insert_missing=True):
+        from google.cloud import bigquery
+
+        if not self.description_hash_added:
+            self.query(f"ALTER TABLE {self.table(raw_jobs)} ADD COLUMN IF NOT EXISTS description_hash STRING")
+            self.description_hash_added = True
+
+        record_write(raw_jobs, paths=paths)
+        temp_table_id = f"{self.project_id}.{raw_jobs}_descriptions_{uuid.uuid4().hex[:8]}"
+        for i, path in enumerate(paths):
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.PARQUET,
+                write_disposition="WRITE_TRUNCATE" if i == 0 else "WRITE_APPEND",
+            )
+            with open(path, "rb") as file:
+                self.client.load_table_from_file(file, temp_table_id, job_config=job_config).result()
+
+        insert_clause = """
+        WHEN NOT MATCHED THEN
+          INSERT (job_id, description, description_hash, created_on, url, location)
+          VALUES (S.job_id, S.description, S.description_hash, S.created_on, S.url, S.location)
+        """ if insert_missing else ""
+        # A job_id can be staged twice (retried after a restart), MERGE needs one source row each
+        merge_query = f"""
+        MERGE {self.table(raw_jobs)} T
+        USING (
+          SELECT job_id, description, description_hash, created_on, url, location FROM `{temp_table_id}`
+          WHERE TRUE
+          QUALIFY ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY created_on DESC) = 1
+        ) S
+        ON T.job_id = S.job_id
+        WHEN MATCHED THEN
+          UPDATE SET T.description = S.description, T.description_hash = S.description_hash,
+            T.created_on = S.created_on, T.url = S.url, T.location = S.location
+        {insert_clause}
+        """
+        try:
+            self.client.query(merge_query).result()
+        finally:
+            self.client.delete_table(temp_table_id, not_found_ok=True)
+
+
+class DuckDBWarehouse(Warehouse):
+    """A local warehouse: one Parquet file per table under root, queried with DuckDB.
+
+    root/raw_data/jobs.parquet holds raw_data.jobs and so on. Every table is
+    loaded into an in-memory DuckDB database on start, and a table is
+    written back to its Parquet file (atomically, through a temp file)
+    after each change. Tables that have no file yet start empty, so the
+    whole pipeline and the dashboard run without GCP.
+    """
+
+    backend = "duckdb"
+    hash_sql = duckdb_description_hash_sql
+    float_type = "DOUBLE"
+    string_types = {"VARCHAR"}
+    string_array_type = "VARCHAR[]"
+
+    split_sql = "list_filter(string_split({column}, ','), lambda term: term != '')"
+    struct_sql = {
+        "salary": """
+            CASE WHEN json_valid(salary) THEN struct_pack(
+              min := TRY_CAST(json_extract_string(salary, '$.min') AS DOUBLE),
+              max := TRY_CAST(json_extract_string(salary, '$.max') AS DOUBLE)
+            ) END
+            """,
+        "education": """
+            CASE WHEN json_valid(education) THEN struct_pack(
+              min_degree := json_extract_string(education, '$.min_degree'),
+              fields := CAST(json_extract(education, '$.fields') AS VARCHAR[])
+            ) END
+            """,
+    }
+
+    schemas = {
+        raw_jobs: {column: "VARCHAR" for column in raw_columns} | {"job_id": "BIGINT", "created_on": "DOUBLE"},
+        extracted_jobs: {column: "VARCHAR" for column in extracted_columns}
+        | {column: "VARCHAR[]" for column in list_columns}
+        | {
+            "salary": "STRUCT(min DOUBLE, max DOUBLE)",
+            "education": "STRUCT(min_degree VARCHAR, fields VARCHAR[])",
+            "job_id": "BIGINT",
+            "created_on": "DOUBLE",
+        },
+        bad_jobs: {column: "VARCHAR" for column in raw_columns + ["error"]} | {"job_id": "BIGINT", "created_on": "DOUBLE"},
+        blacklist: {"company": "VARCHAR"},
+        dedup_watermarks: {"name": "VARCHAR", "watermark": "DOUBLE", "updated_at": "TIMESTAMP"},
+        term_counts: {"keyword": "VARCHAR", "category": "VARCHAR", "term": "VARCHAR", "jobs": "BIGINT"},
+        company_term_counts: {
+            "keyword": "VARCHAR", "company": "VARCHAR", "category": "VARCHAR", "term": "VARCHAR", "jobs": "BIGINT"
+        },
+        salary_summary: {
+            "keyword": "VARCHAR", "min_salary": "DOUBLE", "max_salary": "DOUBLE", "jobs": "BIGINT",
+            "oldest": "VARCHAR", "newest": "VARCHAR",
+        },
+    }
+
+    def __init__(self, root="state/warehouse"):
+        import duckdb  # optional, only needed for local runs
+
+        self.root = root
+        self.lock = threading.RLock()
+        self.connection = duckdb.connect()
+
+        paths = {self._name(path): path for path in glob.glob(os.path.join(root, "*", "*.parquet"))}
+        for name in sorted(set(paths) | set(self.schemas)):
+            self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {name.split('.')[0]}")
+            if name in paths:
+                self.connection.execute(f"CREATE TABLE {name} AS SELECT * FROM read_parquet('{paths[name]}')")
+            else:
+                columns = ", ".join(f"{column} {type_}" for column, type_ in self.schemas[name].items())
+                self.connection.execute(f"CREATE TABLE {name} ({columns})")
+
+    def _name(self, path):
+        dataset = os.path.basename(os.path.dirname(path))
+        return f"{dataset}.{os.path.splitext(os.path.basename(path))[0]}"
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split(".")) + ".parquet"
+
+    def _save(self, name):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection.execute(f"COPY {name} TO '{path}.tmp' (FORMAT parquet)")
+        os.replace(path + ".tmp", path)
+
+    @timed("query")
+    def query(self, sql):
+        with self.lock:
+            return self.connection.execute(sql).df()
+
+    def column_types(self, name):
+        dataset, table = name.split(".")
+        df = self.query(
+            f"""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = '{dataset}' AND table_name = '{table}'
+            """
+        )
+        return dict(zip(df["column_name"], df["data_type"]))
+
+    @timed("dml")
+    def execute(self, sql, table):
+        with self.lock:
+            row = self.connection.execute(sql).fetchone()
+            self._save(table)
+        return int(row[0]) if row else 0
+
+    @timed("replace")
+    def replace_table(self, name, select_sql):
+        with self.lock:
+            self.connection.execute(f"CREATE OR REPLACE TABLE {name} AS {select_sql}")
+            self._save(name)
+
+    @timed("append")
+    def append(self, name, df):
+        record_write(name, df)
+        with self.lock:
+            self.connection.register("batch", df)
+            try:
+                self.connection.execute(f"INSERT INTO {name} BY NAME SELECT * FROM batch")
+            finally:
+                self.connection.unregister("batch")
+            self._save(name)
+
+    @timed("replace")
+    def overwrite(self, name, df):
+        record_write(name, df)
+        with self.lock:
+            self.connection.register("batch", df)
+            try:
+                self.connection.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM batch")
+            finally:
+                self.connection.unregister("batch")
+            self._save(name)
+
+    def quote(self, value):
+        return "'" + value.replace("'", "''") + "'"
+
+    @timed("insert")
+    def insert_new_jobs(self, df):
+        df = df.drop_duplicates("job_id", keep="last")
+        record_write(raw_jobs, df)
+        with self.lock:
+            self.connection.register("batch", df)
+            try:
+                row = self.connection.execute(
+                    f"""
+                    INSERT INTO {raw_jobs} BY NAME
+                    SELECT * FROM batch
+                    WHERE NOT EXISTS (SELECT 1 FROM {raw_jobs} T WHERE T.job_id = batch.job_id)
+                    """
+                ).fetchone()
+            finally:
+                self.connection.unregister("batch")
+            self._save(raw_jobs)
+        return int(row[0])
+
+    @timed("merge")
+    def merge_descriptions(self, paths, insert_missing=True):
+        record_write(raw_jobs, paths=paths)
+        files = ", ".join(f"'{path}'" for path in paths)
+        with self.lock:
+            self.connection.execute(
+                f"""
+                CREATE OR REPLACE TEMP TABLE staged AS
+                SELECT job_id, description, description_hash, created_on, url, location
+                FROM read_parquet([{files}], union_by_name = true)
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY created_on DESC) = 1
+                """
+            )
+            self.connection.execute(
+                f"""
+                UPDATE {raw_jobs} T
+                SET description = S.description, description_hash = S.description_hash,
+                  created_on = S.created_on, url = S.url, location = S.location
+                FROM staged S
+                WHERE T.job_id = S.job_id
+                """
+            )
+            if insert_missing:
+                self.connection.execute(
+                    f"""
+                    INSERT INTO {raw_jobs} BY NAME
+                    SELECT S.* FROM staged S
+                    WHERE NOT EXISTS (SELECT 1 FROM {raw_jobs} T WHERE T.job_id = S.job_id)
+                    """
+                )
+            self._save(raw_jobs)
+
+    def load_csv(self, name, path):
+        """Append a CSV export (e.g. data/sample.csv) to a table, to seed a local warehouse."""
+        self.append_export(name, pd.read_csv(path))
+
+    @timed("append")
+    def append_export(self, name, df):
+        """Append exported rows, whose lists and objects may be strings, parsing them into the table's columns."""
+        if name != extracted_jobs:
+            self.append(name, df)
+            return
+        record_write(name, df)
+        with self.lock:
+            self.connection.register("batch", df)
+            try:
+                types = {row[0]: row[1] for row in self.connection.execute("DESCRIBE batch").fetchall()}
+                self.connection.execute(f"INSERT INTO {name} BY NAME {self.parse_nested_sql('batch', types)}")
+            finally:
+                self.connection.unregister("batch")
+            self._save(name)
+
+
+_warehouses = {}
+_warehouses_lock = threading.Lock()
+
+
+def get_warehouse(backend=None):
+    """The warehouse selected by WAREHOUSE: "bigquery" (default) or "duckdb" under WAREHOUSE_PATH.
+
+    One instance is shared per process, so stages running in the same
+    process (see pipeline/run_pipeline.py) never hold two copies of a local
+    table and overwrite each other's Parquet files.
+    """
+    backend = backend or os.getenv("WAREHOUSE", "bigquery")
+    with _warehouses_lock:
+        if backend not in _warehouses:
+            if backend == "duckdb":
+                _warehouses[backend] = DuckDBWarehouse(os.getenv("WAREHOUSE_PATH", "state/warehouse"))
+            else:
+                _warehouses[backend] = BigQueryWarehouse()
+        return _warehouses[backend]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Seed the local DuckDB warehouse from a CSV export")
+    parser.add_argument("table", nargs="?", help="e.g. extracted_data.jobs")
+    parser.add_argument("csv", nargs="?")
+    parser.add_argument(
+        "--migrate-nested", action="store_true",
+        help="instead, move extracted_data.jobs in the WAREHOUSE warehouse to array and struct columns",
+    )
+    args = parser.parse_args()
+
+    if args.migrate_nested:
+        rows = get_warehouse().migrate_nested_columns()
+        logging.info(f"Migrated {rows} rows of {extracted_jobs}" if rows else f"{extracted_jobs} is already migrated")
+        raise SystemExit
+    if not args.csv:
+        parser.error("table and csv are required")
+
+    warehouse = DuckDBWarehouse(os.getenv("WAREHOUSE_PATH", "state/warehouse"))
+    warehouse.load_csv(args.table, args.csv)
+    logging.info(f"{args.table} now has {warehouse.count(args.table)} rows")
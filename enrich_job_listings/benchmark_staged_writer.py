@@ -0,0 +1,55 @@
+import argparse
+import tempfile
+import time
+
+from common.warehouse import DuckDBWarehouse
+from staged_writer import StagedMergeWriter
+
+
+class CountingWarehouse:
+    """Wraps a warehouse to count merges and time spent merging."""
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self.merges = 0
+        self.elapsed = 0.0
+
+    def merge_descriptions(self, paths, insert_missing=True):
+        start_time = time.perf_counter()
+        self.warehouse.merge_descriptions(paths, insert_missing)
+        self.elapsed += time.perf_counter() - start_time
+        self.merges += 1
+
+
+def fake_rows(count, description_size):
+    description = ("Responsibilities include building data pipelines. " * description_size)[:description_size]
+    for job_id in range(count):
+        yield {
+            "job_id": 4000000000 + job_id,
+            "description": description,
+            "created_on": time.time(),
+            "url": f"https://www.linkedin.com/jobs/view/{4000000000 + job_id}",
+            "location": "Detroit, MI",
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure staged merge throughput against a local DuckDB warehouse")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--merge-rows", type=int, default=5000)
+    parser.add_argument("--description-size", type=int, default=3000, help="characters per description")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        warehouse = CountingWarehouse(DuckDBWarehouse(f"{tmp}/warehouse"))
+        start_time = time.perf_counter()
+        with StagedMergeWriter(warehouse, stage_dir=f"{tmp}/staged", max_rows=args.merge_rows) as writer:
+            for row in fake_rows(args.rows, args.description_size):
+                writer.add(row)
+        elapsed = time.perf_counter() - start_time
+
+        count = warehouse.warehouse.count("raw_data.jobs")
+        print(
+            f"{count} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec), "
+            f"{warehouse.merges} merges, {warehouse.elapsed:.2f}s merging"
+        )
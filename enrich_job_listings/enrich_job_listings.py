@@ -1,13 +1,21 @@
+import argparse
+import os
+import signal
+import sys
 import requests
+import threading
 import time
 import logging
 from bs4 import BeautifulSoup
-import pandas as pd
-import pandas_gbq
-from google.oauth2 import service_account
-from google.cloud import bigquery
 from fake_useragent import UserAgent
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from common import metrics
+from common.fingerprint import description_fingerprint
+from common.warehouse import get_warehouse, raw_jobs
+from journal import EnrichmentJournal
+from page_cache import PageCache
+from staged_writer import StagedMergeWriter
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -15,92 +23,236 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-# Configure BigQuery credentials
-credentials = service_account.Credentials.from_service_account_file("keys/gbq.json")
-project_id = "techlistme"
-dataset_id = "raw_data"
-table_id = "jobs"
-
-client = bigquery.Client(credentials=credentials, project=project_id)
+warehouse = get_warehouse()
 user_agent = UserAgent()
 
-def update_job_descriptions(job_data):
-    temp_table_id = f"{project_id}.{dataset_id}.temp_table"
-    table_id_full = f"{project_id}.{dataset_id}.{table_id}"
-    
-    # Load the data into a temporary table
-    job_data_df = pd.DataFrame(job_data)
-    pandas_gbq.to_gbq(job_data_df, temp_table_id, project_id, if_exists='replace', credentials=credentials)
-
-    # Perform the MERGE operation
-    merge_query = f"""
-    MERGE `{table_id_full}` T
-    USING (
-      SELECT job_id, description, created_on, url, location FROM `{temp_table_id}`
-    ) S
-    ON T.job_id = S.job_id
-    WHEN MATCHED THEN
-      UPDATE SET T.description = S.description, T.created_on = S.created_on, T.url = S.url, T.location = S.location
-    WHEN NOT MATCHED THEN
-      INSERT (job_id, description, created_on, url, location) VALUES (S.job_id, S.description, S.created_on, S.url, S.location)
+# Concurrency settings: the number of requests in flight starts at the initial
+# value and moves between the min and max as LinkedIn answers with 200s or 429s
+initial_concurrency = int(os.getenv("ENRICH_INITIAL_CONCURRENCY", "2"))
+min_concurrency = int(os.getenv("ENRICH_MIN_CONCURRENCY", "1"))
+max_concurrency = int(os.getenv("ENRICH_MAX_CONCURRENCY", "16"))
+rate_limit_backoff = float(os.getenv("ENRICH_RATE_LIMIT_BACKOFF", "2"))
+
+# Where job pages are fetched from; saved rows always keep the linkedin.com url
+linkedin_url = os.getenv("LINKEDIN_URL", "https://www.linkedin.com")
+
+# Enriched rows are staged locally and merged once this many are staged or
+# this many seconds have passed
+merge_rows = int(os.getenv("ENRICH_MERGE_ROWS", "5000"))
+merge_seconds = float(os.getenv("ENRICH_MERGE_SECONDS", "600"))
+
+# Every fetched page is journaled here first, so a restart replays instead of re-fetching
+journal_path = os.getenv("ENRICH_JOURNAL", "state/enrich_journal.sqlite")
+
+# Optional raw page cache, so parsing changes can be backfilled without re-crawling
+page_cache_dir = os.getenv("ENRICH_PAGE_CACHE")
+page_cache_ttl = float(os.getenv("ENRICH_PAGE_CACHE_TTL_DAYS", "90")) * 86400
+page_cache = PageCache(page_cache_dir, ttl=page_cache_ttl) if page_cache_dir else None
+
+
+class AdaptiveLimiter:
+    """AIMD limit on requests in flight, shared by every enrichment worker.
+
+    Each 200 raises the limit by 1/limit, so about one slot per full round of
+    requests. A 429 halves the limit and pauses every worker. The pause
+    doubles while 429s continue and resets after the next 200. 429s from
+    requests already in flight during a pause do not shrink the limit again.
     """
 
-    client.query(merge_query).result()
-    client.delete_table(temp_table_id, not_found_ok=True)
-    logging.info(f"Updated {len(job_data)} job descriptions in BigQuery")
+    def __init__(self, initial, minimum, maximum, backoff, max_backoff=300):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.base_backoff = backoff
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
 
-def job_detail_request(job_id, max_retries=8, base_delay=2):
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+            metrics.in_flight.set(self.in_flight, stage="enrich")
+
+    def release(self, status_code):
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status_code == 429 and now >= self.paused_until:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.paused_until = now + self.backoff
+                metrics.rate_limited.inc(stage="enrich")
+                logging.warning(
+                    f"Rate limited. Pausing for {self.backoff} seconds, concurrency now {int(self.limit)}"
+                )
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+            elif status_code == 200:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.backoff = self.base_backoff
+            metrics.in_flight.set(self.in_flight, stage="enrich")
+            metrics.concurrency_limit.set(self.limit, stage="enrich")
+            self.condition.notify_all()
+
+
+def create_session(pool_size):
+    # Keep-alive connections shared by all workers
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+
+session = create_session(max_concurrency)
+limiter = AdaptiveLimiter(initial_concurrency, min_concurrency, max_concurrency, rate_limit_backoff)
+
+def create_writer(on_merge=None, insert_missing=True):
+    """Staged writer that merges enriched rows into raw_data.jobs in bulk."""
+    return StagedMergeWriter(
+        warehouse,
+        stage_dir=os.getenv("ENRICH_STAGE_DIR", "state/staged"),
+        max_rows=merge_rows,
+        max_seconds=merge_seconds,
+        on_merge=on_merge,
+        insert_missing=insert_missing,
+    )
+
+def parse_job_detail(job_id, content):
+    start_time = time.perf_counter()
     url = f"https://www.linkedin.com/jobs/view/{job_id}"
+    soup = BeautifulSoup(content, "html.parser")
+    description = soup.find(attrs={"class": "show-more-less-html__markup"})
+    description = description.getText(separator="\n", strip=True) if description else ""
+    location = soup.find(attrs={"class": "topcard__flavor--bullet"}).text.strip()
+    metrics.parse_seconds.observe(time.perf_counter() - start_time, stage="enrich")
+    metrics.pages_parsed.inc(stage="enrich")
+    return {
+        "job_id": job_id,
+        "description": description,
+        "description_hash": description_fingerprint(description),
+        "created_on": time.time(),
+        "url": url,
+        "location": location,
+    }
+
+def job_detail_request(job_id, max_retries=8):
+    url = f"https://www.linkedin.com/jobs/view/{job_id}"
+    request_url = f"{linkedin_url}/jobs/view/{job_id}"
     for retry in range(max_retries):
+        status_code = None
+        limiter.acquire()
         try:
             headers = {"User-Agent": user_agent.random}
-            response = requests.get(url=url, headers=headers, timeout=5)
+            with metrics.http_request_seconds.time(stage="enrich"):
+                response = session.get(url=request_url, headers=headers, timeout=5)
+            status_code = response.status_code
             logging.info(f"job_id: {job_id} status_code: {response.status_code}")
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, "html.parser")
-                description = soup.find(attrs={"class": "show-more-less-html__markup"})
-                description = description.getText(separator="\n", strip=True) if description else ""
-                location = soup.find(attrs={"class": "topcard__flavor--bullet"}).text.strip()
-                return {"job_id": job_id, "description": description, "created_on": time.time(), "url": url, "location": location}
+                if page_cache:
+                    try:
+                        page_cache.put(job_id, response.content)
+                    except Exception as e:
+                        logging.warning(f"Failed to cache page for job_id {job_id}: {e}")
+                return parse_job_detail(job_id, response.content)
 
             if response.status_code in [400, 404]:
                 logging.warning(f"Job ID: {job_id} may be invalid or deleted.")
                 return {"job_id": job_id, "description": "", "created_on": time.time(), "url": url}
 
-            if response.status_code == 429:
-                sleep_time = base_delay * (2 ** retry)
-                logging.warning(f"Rate limited. Retrying after {sleep_time} seconds...")
-                time.sleep(sleep_time)
-                continue
-
         except Exception as e:
             logging.error(f"Error in job_detail_request for job_id {job_id}: {e}")
 
+        finally:
+            metrics.http_requests.inc(stage="enrich", status=status_code or "error")
+            limiter.release(status_code)
+
     logging.error(f"Failed to retrieve job_id: {job_id} after {max_retries} retries")
     return {"job_id": job_id, "description": "", "created_on": time.time(), "url": url}
 
-def enrich_jobs(batch_size=100, max_workers=1):
-    query = f"""
-    SELECT job_id FROM `{project_id}.{dataset_id}.{table_id}`
-    WHERE description IS NULL
-    ORDER BY created_on
-    """
-    job_ids = client.query(query).to_dataframe()["job_id"].tolist()
+def enrich_jobs(max_workers=max_concurrency):
+    job_ids = warehouse.jobs_without_description()
+
+    journal = EnrichmentJournal(journal_path)
+    journal.compact()
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_job = {executor.submit(job_detail_request, job_id): job_id for job_id in job_ids}
-        job_data = []
+    # Only a bounded number of jobs is submitted ahead of the workers; the
+    # limiter decides how many of those are actually fetching at once
+    max_pending = max_workers * 2
+    pending = set()
 
-        for future in as_completed(future_to_job):
-            job_data.append(future.result())
+    def save(result):
+        journal.record(result)
+        writer.add(result)
 
-            if len(job_data) >= batch_size:
-                update_job_descriptions(job_data)
-                job_data = []
+    with create_writer(journal.mark_merged) as writer, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Results fetched before a restart but never merged
+        replayed = journal.pending()
+        if replayed:
+            logging.info(f"Replaying {len(replayed)} journaled job descriptions")
+        for result in replayed:
+            writer.add(result)
+        replayed_ids = {result["job_id"] for result in replayed}
+
+        for job_id in job_ids:
+            if job_id in replayed_ids:
+                continue
+            pending.add(executor.submit(job_detail_request, job_id))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    save(future.result())
 
-        if job_data:
-            update_job_descriptions(job_data)
+        for future in wait(pending).done:
+            save(future.result())
+
+def reparse_from_cache():
+    """Re-run parse_job_detail over every cached page and merge the results, without any requests.
+
+    Only jobs still in raw_data.jobs are reparsed. Jobs that were extracted
+    or moved to bad_jobs since are left alone, and the merge only updates
+    rows, so it never brings them back as raw jobs.
+    """
+    if page_cache is None:
+        sys.exit("Set ENRICH_PAGE_CACHE to the page cache directory to reparse")
+
+    page_cache.purge_expired()
+    raw_job_ids = set(warehouse.raw_job_ids())
+    cached_job_ids = page_cache.job_ids()
+    job_ids = [job_id for job_id in cached_job_ids if job_id in raw_job_ids]
+    logging.info(
+        f"Reparsing {len(job_ids)} cached job pages - skipping {len(cached_job_ids) - len(job_ids)} "
+        f"no longer in {raw_jobs}"
+    )
+
+    with create_writer(insert_missing=False) as writer:
+        for job_id in job_ids:
+            content = page_cache.get(job_id)
+            if content is None:
+                continue
+            try:
+                writer.add(parse_job_detail(job_id, content))
+            except Exception as e:
+                logging.error(f"Error reparsing cached page for job_id {job_id}: {e}")
 
 if __name__ == "__main__":
-    enrich_jobs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fetch descriptions for jobs that do not have one yet")
+    parser.add_argument("--reparse", action="store_true", help="rebuild descriptions from the page cache instead of fetching")
+    args = parser.parse_args()
+
+    # Turn a pod shutdown into SystemExit so the staged writer gets its final flush
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    metrics.start_exporter()
+    if args.reparse:
+        reparse_from_cache()
+    else:
+        if page_cache:
+            page_cache.purge_expired()
+        enrich_jobs()
\ No newline at end of file
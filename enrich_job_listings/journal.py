@@ -0,0 +1,53 @@
+import json
+import sqlite3
+import threading
+
+
+class EnrichmentJournal:
+    """Append-only SQLite log of fetched job pages that survives pod restarts.
+
+    Every result is committed with synchronous=FULL before it goes to the
+    writer, and marked merged once the warehouse has it. After a restart,
+    pending() returns what was fetched but never merged, so those pages are
+    replayed instead of fetched again.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+              job_id INTEGER PRIMARY KEY,
+              row TEXT NOT NULL,
+              merged INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+    def record(self, row):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (job_id, row, merged) VALUES (?, ?, 0)",
+                (int(row["job_id"]), json.dumps(row)),
+            )
+
+    def pending(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT row FROM results WHERE merged = 0").fetchall()
+        return [json.loads(row) for (row,) in rows]
+
+    def mark_merged(self, job_ids):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "UPDATE results SET merged = 1 WHERE job_id = ?", [(int(job_id),) for job_id in job_ids]
+            )
+            self.connection.execute("COMMIT")
+
+    def compact(self):
+        """Drop results the warehouse already has."""
+        with self.lock:
+            self.connection.execute("DELETE FROM results WHERE merged = 1")
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class LocalObjectStore:
+    """Directory of blobs standing in for a bucket: put/get/delete by key."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temp file of its own, so two workers storing the same blob never write into one file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class PageCache:
+    """zstd-compressed job detail pages, stored once per content hash.
+
+    An SQLite index maps each job_id to the sha256 of its page and when it
+    was fetched. Blobs live in the object store under objects/<hash>.zst, so
+    identical pages are stored once. Entries older than ttl seconds are
+    dropped by purge_expired() and ignored by get().
+    """
+
+    def __init__(self, root, ttl=90 * 86400, level=10):
+        import zstandard  # optional, only needed when the cache is enabled
+
+        os.makedirs(root, exist_ok=True)
+        self.store = LocalObjectStore(root)
+        self.ttl = ttl
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+              job_id INTEGER PRIMARY KEY,
+              hash TEXT NOT NULL,
+              fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def _key(digest):
+        return f"objects/{digest[:2]}/{digest}.zst"
+
+    def put(self, job_id, content):
+        digest = hashlib.sha256(content).hexdigest()
+        if not self.store.exists(self._key(digest)):
+            self.store.put(self._key(digest), self.compressor.compress(content))
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (job_id, hash, fetched_at) VALUES (?, ?, ?)",
+                (int(job_id), digest, time.time()),
+            )
+            self.connection.commit()
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT hash, fetched_at FROM pages WHERE job_id = ?", (int(job_id),)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        data = self.store.get(self._key(row[0]))
+        return self.decompressor.decompress(data) if data is not None else None
+
+    def job_ids(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT job_id FROM pages WHERE fetched_at >= ? ORDER BY job_id", (time.time() - self.ttl,)
+            ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def purge_expired(self):
+        """Drops expired entries and any blob no longer referenced."""
+        with self.lock:
+            expired = self.connection.execute(
+                "SELECT DISTINCT hash FROM pages WHERE fetched_at < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            self.connection.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.ttl,))
+            self.connection.commit()
+            for (digest,) in expired:
+                referenced = self.connection.execute(
+                    "SELECT 1 FROM pages WHERE hash = ? LIMIT 1", (digest,)
+                ).fetchone()
+                if referenced is None:
+                    self.store.delete(self._key(digest))
+        return len(expired)
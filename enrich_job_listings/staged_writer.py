@@ -0,0 +1,133 @@
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+merge_columns = ["job_id", "description", "description_hash", "created_on", "url", "location"]
+
+
+class StagedMergeWriter:
+    """Buffers enriched rows as local Parquet files and merges them in bulk.
+
+    Rows are written to a Parquet file in stage_dir every chunk_rows rows.
+    A background thread merges the staged files into the warehouse once
+    max_rows rows are staged or max_seconds have passed since the last
+    merge, so add() only ever writes a local file. Files are deleted after
+    their merge succeeds; a failed merge is logged and retried with the next
+    one, and close() merges what is left in the caller's thread. Files left
+    behind by a crash are merged by the next writer on startup. on_merge, if
+    given, is called with the job_ids of every successful merge.
+
+    With insert_missing=False the merge only updates jobs still in the
+    warehouse and never re-creates one. Each file's name records how it was
+    staged, so leftovers are merged the way their writer would have merged
+    them, whichever writer finds them.
+    """
+
+    def __init__(self, warehouse, stage_dir="state/staged", chunk_rows=500, max_rows=5000, max_seconds=600,
+                 on_merge=None, insert_missing=True):
+        self.warehouse = warehouse
+        self.on_merge = on_merge
+        self.insert_missing = insert_missing
+        self.stage_dir = stage_dir
+        self.chunk_rows = chunk_rows
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+        self.merge_due = threading.Condition(self.lock)
+        self.buffer = []
+        self.staged_rows = 0
+        self.closing = False
+        self.last_merge = time.monotonic()
+        os.makedirs(stage_dir, exist_ok=True)
+
+        leftover = self._staged_files()
+        if leftover:
+            logging.info(f"Merging {len(leftover)} staged files left by a previous run")
+            self._merge(leftover)
+
+        self.thread = threading.Thread(target=self._run, name="staged-merge", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, row):
+        with self.lock:
+            self.buffer.append(row)
+            overdue = time.monotonic() - self.last_merge >= self.max_seconds
+            if len(self.buffer) >= self.chunk_rows or overdue:
+                self._stage()
+            if self.staged_rows >= self.max_rows or overdue:
+                self.merge_due.notify()
+
+    def close(self):
+        with self.lock:
+            self._stage()
+            self.closing = True
+            self.merge_due.notify()
+        self.thread.join()
+        self._merge(self._staged_files())
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.closing and self.staged_rows < self.max_rows:
+                    remaining = self.max_seconds - (time.monotonic() - self.last_merge)
+                    if remaining <= 0:
+                        self._stage()
+                        break
+                    self.merge_due.wait(remaining)
+                if self.closing:
+                    return
+                paths = self._staged_files()
+                self.staged_rows = 0
+                self.last_merge = time.monotonic()
+            try:
+                self._merge(paths)
+            except Exception as e:
+                # The files stay staged, so the next merge or close() picks them up
+                logging.error(f"Failed to merge {len(paths)} staged files of job descriptions: {e}")
+
+    def _staged_files(self):
+        return sorted(glob.glob(os.path.join(self.stage_dir, "*.parquet")))
+
+    def _stage(self):
+        if not self.buffer:
+            return
+        df = pd.DataFrame(self.buffer).reindex(columns=merge_columns)
+        # Fix the types so an all-null column in one chunk still matches the others
+        df = df.astype({"job_id": "int64", "description": "string", "description_hash": "string",
+                        "created_on": "float64", "url": "string", "location": "string"})
+        # Name files by time so leftovers merge in the order they were written
+        mode = "upsert" if self.insert_missing else "update"
+        path = os.path.join(self.stage_dir, f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.{mode}.parquet")
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        self.staged_rows += len(self.buffer)
+        self.buffer = []
+
+    def _merge(self, paths):
+        with self.merge_lock:
+            # Files staged update-only are never merged with inserts; files without a mode predate it
+            update_only = [path for path in paths if path.endswith(".update.parquet")]
+            upsert = [path for path in paths if not path.endswith(".update.parquet")]
+            for insert_missing, group in [(True, upsert), (False, update_only)]:
+                if not group:
+                    continue
+                start_time = time.time()
+                self.warehouse.merge_descriptions(group, insert_missing=insert_missing)
+                if self.on_merge:
+                    self.on_merge(pd.concat(pd.read_parquet(path, columns=["job_id"]) for path in group)["job_id"])
+                for path in group:
+                    os.remove(path)
+                elapsed = time.time() - start_time
+                logging.info(f"Merged {len(group)} staged files of job descriptions - elapsed: {elapsed:.2f}")
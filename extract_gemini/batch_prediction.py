@@ -0,0 +1,186 @@
+import glob
+import json
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Lines follow the Vertex AI batch prediction format for Gemini: one
+# {"request": ...} per line in, and the same request with its "response"
+# (or an error in "status") per line out.
+
+
+def request_line(contents, system_instruction):
+    return {
+        "request": {
+            "contents": [{"role": "user", "parts": [{"text": contents}]}],
+            "systemInstruction": {"parts": [{"text": system_instruction}]},
+            "generationConfig": {"responseMimeType": "application/json"},
+        }
+    }
+
+
+def write_requests(path, prompts, system_instruction):
+    with open(path, "w", encoding="utf-8") as file:
+        for contents in prompts:
+            file.write(json.dumps(request_line(contents, system_instruction)) + "\n")
+
+
+def read_predictions(paths):
+    """(prompt, response text, error, usage) for every line of the prediction files.
+
+    The response text is None when the line failed; usage is the response's
+    usageMetadata, or {}.
+    """
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                prediction = json.loads(line)
+                contents = prediction["request"]["contents"][0]["parts"][0]["text"]
+                response = prediction.get("response") or {}
+                try:
+                    text = response["candidates"][0]["content"]["parts"][0]["text"]
+                except (KeyError, IndexError):
+                    yield contents, None, prediction.get("status") or "no response", {}
+                    continue
+                yield contents, text, None, response.get("usageMetadata", {})
+
+
+class VertexBatchPredictor:
+    """Vertex AI batch prediction, with each job's files under a gs:// prefix."""
+
+    def __init__(self, model, uri_prefix, project, location):
+        import vertexai
+        from google.cloud import storage
+
+        vertexai.init(project=project, location=location)
+        self.model = model
+        self.uri_prefix = uri_prefix.rstrip("/")
+        self.storage = storage.Client(project=project)
+
+    def _blob(self, uri):
+        bucket, _, name = uri.removeprefix("gs://").partition("/")
+        return self.storage.bucket(bucket).blob(name)
+
+    def submit(self, requests_path):
+        """Upload the request file and start a job; returns the job's name."""
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        prefix = f"{self.uri_prefix}/extract-{uuid.uuid4().hex[:8]}"
+        self._blob(f"{prefix}/requests.jsonl").upload_from_filename(requests_path)
+        job = BatchPredictionJob.submit(
+            source_model=self.model,
+            input_dataset=f"{prefix}/requests.jsonl",
+            output_uri_prefix=f"{prefix}/output",
+        )
+        return job.resource_name
+
+    def state(self, name):
+        """The job's state: running, succeeded or failed."""
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        job = BatchPredictionJob(name)
+        if not job.has_ended:
+            return "running"
+        return "succeeded" if job.has_succeeded else "failed"
+
+    def cancel(self, name):
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        BatchPredictionJob(name).cancel()
+
+    def predictions(self, name, directory):
+        """Download the job's prediction files into directory; returns their paths."""
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        bucket, _, prefix = BatchPredictionJob(name).output_location.removeprefix("gs://").partition("/")
+        paths = []
+        for blob in self.storage.list_blobs(bucket, prefix=prefix):
+            if blob.name.endswith(".jsonl"):
+                path = os.path.join(directory, f"predictions-{len(paths)}.jsonl")
+                blob.download_to_filename(path)
+                paths.append(path)
+        return paths
+
+
+class LocalBatchPredictor:
+    """File-based stand-in for Vertex AI batch prediction, for running and benchmarking without GCP.
+
+    submit() copies the request file to root/<job>/requests.jsonl and answers
+    it in the background, line by line, with the model make_model(system
+    instruction) returns. The results go to root/<job>/predictions.jsonl,
+    and root/<job>/state says whether the job is running, succeeded, failed
+    or cancelled.
+    """
+
+    def __init__(self, root, make_model, workers=4):
+        self.root = root
+        self.make_model = make_model
+        self.workers = workers
+
+    def _path(self, name, file_name):
+        return os.path.join(self.root, name, file_name)
+
+    def _set_state(self, name, state):
+        if os.path.exists(self._path(name, "cancelled")):
+            state = "cancelled"
+        with open(self._path(name, "state.tmp"), "w", encoding="utf-8") as file:
+            file.write(state)
+        os.replace(self._path(name, "state.tmp"), self._path(name, "state"))
+
+    def _predict(self, line):
+        request = json.loads(line)["request"]
+        model = self.make_model(request["systemInstruction"]["parts"][0]["text"])
+        try:
+            response = model.generate_content(request["contents"][0]["parts"][0]["text"])
+        except Exception as e:
+            return {"request": request, "status": str(e)}
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "request": request,
+            "status": "",
+            "response": {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": response.text}]}}],
+                "usageMetadata": {
+                    "promptTokenCount": usage.prompt_token_count if usage else 0,
+                    "candidatesTokenCount": usage.candidates_token_count if usage else 0,
+                },
+            },
+        }
+
+    def _run(self, name):
+        try:
+            with open(self._path(name, "requests.jsonl"), "r", encoding="utf-8") as file:
+                lines = [line for line in file if line.strip()]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                predictions = list(executor.map(self._predict, lines))
+            with open(self._path(name, "predictions.jsonl"), "w", encoding="utf-8") as file:
+                for prediction in predictions:
+                    file.write(json.dumps(prediction) + "\n")
+            self._set_state(name, "succeeded")
+        except Exception:
+            self._set_state(name, "failed")
+            raise
+
+    def submit(self, requests_path):
+        name = f"extract-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.join(self.root, name))
+        shutil.copyfile(requests_path, self._path(name, "requests.jsonl"))
+        self._set_state(name, "running")
+        threading.Thread(target=self._run, args=(name,), name=f"batch-{name}", daemon=True).start()
+        return name
+
+    def state(self, name):
+        with open(self._path(name, "state"), "r", encoding="utf-8") as file:
+            return file.read()
+
+    def cancel(self, name):
+        # The background thread still finishes, but the job stays cancelled
+        open(self._path(name, "cancelled"), "w").close()
+        self._set_state(name, "cancelled")
+
+    def predictions(self, name, directory):
+        return sorted(glob.glob(self._path(name, "predictions*.jsonl")))
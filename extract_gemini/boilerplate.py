@@ -0,0 +1,85 @@
+import re
+from collections import Counter
+
+from common.fingerprint import normalize_description
+
+# Sentence ends, and line breaks for descriptions that still have them
+_segment_end = re.compile(r"(?<=[.!?;])\s+(?=[A-Z0-9\"'(])|\s*\n+\s*")
+
+
+def split_segments(text):
+    return [segment for segment in _segment_end.split(text) if segment.strip()]
+
+
+class BoilerplateIndex:
+    """Sentence frequencies over a corpus of descriptions, for stripping repeated text.
+
+    A sentence is boilerplate if it appears in at least min_jobs distinct
+    descriptions (EEO statements, legal disclaimers), or in at least
+    min_company_jobs distinct descriptions from one company (its "about us"
+    block). Sentences are compared normalized, so punctuation, case and
+    spacing do not matter. Sentences shorter than min_chars are never
+    stripped, and neither are sentences that mention a protected term (the
+    tech stack and languages already extracted from the corpus), so a
+    company's standard stack description stays in. If stripping would leave
+    less than min_kept of a description, only the corpus-wide boilerplate is
+    stripped from it.
+    """
+
+    def __init__(self, min_jobs=25, min_company_jobs=3, min_chars=40, min_kept=0.3, protected_terms=()):
+        self.min_jobs = min_jobs
+        self.min_company_jobs = min_company_jobs
+        self.min_chars = min_chars
+        self.min_kept = min_kept
+        self.jobs = Counter()  # sentence key -> descriptions containing it
+        self.company_jobs = Counter()  # (company, sentence key) -> descriptions from the company containing it
+        self.protected_words = set()
+        self.protected_phrases = set()
+        for term in protected_terms:
+            term = normalize_description(term)
+            if len(term) < 3:
+                continue
+            (self.protected_phrases if " " in term else self.protected_words).add(term)
+
+    def _key(self, segment):
+        normalized = normalize_description(segment)
+        return hash(normalized) if len(normalized) >= self.min_chars else None
+
+    def _protected(self, segment):
+        normalized = normalize_description(segment)
+        if self.protected_words.intersection(normalized.split()):
+            return True
+        padded = f" {normalized} "
+        return any(f" {phrase} " in padded for phrase in self.protected_phrases)
+
+    def add(self, company, description):
+        """Count one distinct description; duplicates should be added once."""
+        keys = {key for key in map(self._key, split_segments(description)) if key is not None}
+        company = normalize_description(company)
+        self.jobs.update(keys)
+        self.company_jobs.update((company, key) for key in keys)
+
+    def strip(self, company, description):
+        """description without its boilerplate sentences."""
+        segments = split_segments(description)
+        if not segments:
+            return description
+        company = normalize_description(company)
+
+        common = []
+        from_company = []
+        for segment in segments:
+            key = self._key(segment)
+            common.append(key is not None and self.jobs[key] >= self.min_jobs)
+            from_company.append(key is not None and self.company_jobs[(company, key)] >= self.min_company_jobs)
+
+        for strip_company in [True, False]:
+            kept = [
+                segment
+                for segment, is_common, is_from_company in zip(segments, common, from_company)
+                if not (is_common or (strip_company and is_from_company)) or self._protected(segment)
+            ]
+            text = " ".join(kept)
+            if len(text) >= self.min_kept * len(description):
+                return text
+        return description
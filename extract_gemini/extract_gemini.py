@@ -1,14 +1,24 @@
 import os
+import random
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import json
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import time
 import logging
-from google.oauth2 import service_account
-from google.cloud import bigquery
+import hashlib
+from collections import Counter
 import pandas as pd
-import pandas_gbq
+from common import metrics
+from common.fingerprint import description_fingerprint
+from common.warehouse import get_warehouse
+from batch_prediction import LocalBatchPredictor, VertexBatchPredictor, read_predictions, write_requests
+from boilerplate import BoilerplateIndex
+from extraction_cache import ExtractionCache
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -21,90 +31,66 @@ logging.basicConfig(
 load_dotenv()
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-# Configure BigQuery credentials
-credentials = service_account.Credentials.from_service_account_file("keys/gbq.json")
-project_id = "techlistme"
+warehouse = get_warehouse()
 source_table_id = "raw_data.jobs"
 destination_table_id = "extracted_data.jobs"
 bad_jobs_table_id = "raw_data.bad_jobs"
 
-client = bigquery.Client(credentials=credentials, project=project_id)
-
-
-def load_remaining_jobs(batch_size=10):
-    """Load remaining jobs from BigQuery"""
-    query = f"""
-    WITH remaining_jobs AS (
-        SELECT r.job_id, r.description, r.task_id, r.keyword, r.location, r.company, r.title, r.created_on, r.url
-        FROM `{project_id}.{source_table_id}` r
-        LEFT JOIN `{project_id}.{destination_table_id}` e ON r.job_id = e.job_id
-        LEFT JOIN `{project_id}.{bad_jobs_table_id}` b ON r.job_id = b.job_id
-        WHERE e.job_id IS NULL AND b.job_id IS NULL
-        AND r.description IS NOT NULL AND r.description != ""
-    )
-    SELECT *
-    FROM remaining_jobs
-    ORDER BY created_on
-    LIMIT {batch_size}
-    """
-    df = client.query(query).to_dataframe()
-    df['job_id'] = df['job_id'].astype(int)  # Ensure job_id is treated as an integer
-    return df.to_dict(orient="records")
-
-
-def save_jobs(df, table_id):
-    """Save jobs to BigQuery"""
-    pandas_gbq.to_gbq(
-        df,
-        table_id,
-        project_id,
-        if_exists="append",
-        credentials=credentials,
-    )
-    logging.info(f"Saved {len(df)} jobs to {table_id}")
-
-
-def delete_jobs_from_raw(job_ids):
-    """Delete jobs from raw_data.jobs"""
-    job_ids_str = ', '.join(str(id) for id in job_ids)  # Convert to string for SQL
-    delete_query = f"""
-    DELETE FROM `{project_id}.{source_table_id}`
-    WHERE job_id IN ({job_ids_str})
-    """
-    client.query(delete_query).result()
-    logging.info(f"Deleted {len(job_ids)} jobs from {source_table_id}")
-
-
-def convert_column(column):
-    if column.apply(type).eq(list).all():
-        # Convert lists to comma-separated strings
-        return column.apply(lambda x: ",".join(x) if isinstance(x, list) else x)
-    elif column.apply(type).eq(dict).all():
-        # Convert dicts to JSON strings
-        return column.apply(lambda x: json.dumps(x) if isinstance(x, dict) else x)
-    return column
-
-
-def convert_all_columns(data):
-    for column in data.columns:
-        data[column] = convert_column(data[column])
-    return data
-
-
-def extract_job_description(jobs):
-    count_done = 0
-    count_errors = 0
-    updated_jobs = []
-    bad_jobs = []
-
-    for job in jobs:
-        try:
-            start_time = time.time()
+# Jobs in flight at once, and the quota they share: requests and tokens per
+# minute (the Gemini 1.5 Flash pay-as-you-go limits by default)
+max_concurrency = int(os.getenv("EXTRACT_CONCURRENCY", "16"))
+requests_per_minute = float(os.getenv("EXTRACT_REQUESTS_PER_MINUTE", "2000"))
+tokens_per_minute = float(os.getenv("EXTRACT_TOKENS_PER_MINUTE", "4000000"))
+output_token_estimate = int(os.getenv("EXTRACT_OUTPUT_TOKEN_ESTIMATE", "600"))
+
+# Up to batch_jobs descriptions, and about batch_tokens tokens of them, go in
+# one request; 1 sends every description on its own
+batch_jobs = int(os.getenv("EXTRACT_BATCH_JOBS", "8"))
+batch_tokens = int(os.getenv("EXTRACT_BATCH_TOKENS", "12000"))
+
+# Optional cache of extracted fields, so a description seen before (a reposted
+# job, say) is not sent to Gemini again
+cache_path = os.getenv("EXTRACT_CACHE")
+
+# Sentences repeated across many descriptions (EEO statements, disclaimers) or
+# across one company's descriptions ("about us") are left out of the prompt.
+# The index is learned from the newest corpus_jobs descriptions; 0 turns it off.
+boilerplate_corpus_jobs = int(os.getenv("EXTRACT_BOILERPLATE_CORPUS_JOBS", "20000"))
+boilerplate_min_jobs = int(os.getenv("EXTRACT_BOILERPLATE_MIN_JOBS", "25"))
+boilerplate_min_company_jobs = int(os.getenv("EXTRACT_BOILERPLATE_MIN_COMPANY_JOBS", "3"))
+
+# A backlog of at least batch_prediction_min_jobs goes through batch
+# prediction, up to batch_prediction_max_jobs jobs per prediction job, and
+# the rest online. EXTRACT_BATCH_PREDICTION is "vertex" (Vertex AI, with the
+# files under the gs:// EXTRACT_BATCH_PREDICTION_URI) or "local", a stand-in
+# that keeps the files under that path and answers them with the online
+# model. Unset, every job is extracted online. A prediction job still
+# running after batch_prediction_max_wait_seconds is cancelled and its jobs
+# are extracted online.
+batch_prediction = os.getenv("EXTRACT_BATCH_PREDICTION")
+batch_prediction_uri = os.getenv("EXTRACT_BATCH_PREDICTION_URI", "state/batch_prediction")
+batch_prediction_model = os.getenv("EXTRACT_BATCH_PREDICTION_MODEL", "gemini-1.5-flash-002")
+batch_prediction_project = os.getenv("EXTRACT_BATCH_PREDICTION_PROJECT", "techlistme")
+batch_prediction_location = os.getenv("EXTRACT_BATCH_PREDICTION_LOCATION", "us-central1")
+batch_prediction_min_jobs = int(os.getenv("EXTRACT_BATCH_PREDICTION_MIN_JOBS", "2000"))
+batch_prediction_max_jobs = int(os.getenv("EXTRACT_BATCH_PREDICTION_MAX_JOBS", "50000"))
+batch_prediction_poll_seconds = float(os.getenv("EXTRACT_BATCH_PREDICTION_POLL_SECONDS", "60"))
+batch_prediction_max_wait_seconds = float(os.getenv("EXTRACT_BATCH_PREDICTION_MAX_WAIT_SECONDS", "86400"))
+
+# Rate limits, server errors and timeouts are retried this many times, waiting
+# about retry_backoff seconds, doubling each time
+max_retries = int(os.getenv("EXTRACT_MAX_RETRIES", "5"))
+retry_backoff = float(os.getenv("EXTRACT_RETRY_BACKOFF", "2"))
+rate_limit_errors = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)
+transient_errors = rate_limit_errors + (
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError,
+    ConnectionError,
+)
 
-            model = genai.GenerativeModel(
-                "models/gemini-1.5-flash-latest",
-                generation_config={"response_mime_type": "application/json"},
-                system_instruction="""
+system_instruction = """
                                 
                                 summarize/extract the data from this job description that returns a json with this exact schema: 
                                 
@@ -142,35 +128,537 @@ def extract_job_description(jobs):
                                     "Odds-Ratios", "T-Tests", "Chi-Squared", "ANOVA", "Git",
                                     "Access", "Word", "PowerPoint", "Excel"
                                 ], 
-                                """,
+                                """
+
+
+batch_system_instruction = system_instruction + """
+                                you will get a json array of job postings, each with a "job_id" and a "description".
+                                return a json array with one object per posting, in any order, each with the
+                                posting's "job_id" and the fields above extracted from its description alone.
+                                """
+
+
+model_name = "models/gemini-1.5-flash-latest"
+extraction_fields = ["summary", "industries", "soft_skills", "hard_skills", "tech_stack",
+                     "programming_languages", "education", "salary", "benefits"]
+
+
+def make_prompt_version(model):
+    return hashlib.sha256(
+        "\n".join([model, system_instruction, batch_system_instruction]).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+# Part of every cache key, so editing the prompts or switching models starts a
+# fresh cache; results made by batch prediction are keyed by the batch model
+prompt_version = make_prompt_version(model_name)
+batch_prompt_version = make_prompt_version(batch_prediction_model)
+
+
+class RateBudget:
+    """Requests- and tokens-per-minute budget shared by every extraction worker.
+
+    Both refill continuously at their per-minute rate and hold at most about
+    a second's worth, so requests are spread evenly over the minute instead
+    of arriving in one burst. acquire() blocks until there is room for one
+    request of the estimated size and takes it; settle() corrects the
+    estimate once the response says how many tokens were used. pause() holds
+    back every worker, e.g. after a 429.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.request_rate = requests_per_minute / 60
+        self.token_rate = tokens_per_minute / 60
+        self.request_capacity = max(1.0, self.request_rate)
+        self.token_capacity = self.token_rate
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_rate)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_rate)
+        self.updated = now
+
+    def acquire(self, tokens):
+        """Wait for room for a request of about this many tokens; returns the tokens reserved."""
+        tokens = min(tokens, self.token_capacity)
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    delay = max((1 - self.requests) / self.request_rate, (tokens - self.tokens) / self.token_rate)
+                    if delay <= 0:
+                        break
+                self.condition.wait(delay)
+            self.requests -= 1
+            self.tokens -= tokens
+            return tokens
+
+    def settle(self, reserved, used):
+        with self.condition:
+            self.tokens -= used - reserved
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+budget = RateBudget(requests_per_minute, tokens_per_minute)
+models = {}  # created on first use and shared by every worker
+model_lock = threading.Lock()
+cache = ExtractionCache(cache_path) if cache_path else None
+boilerplate_index = None  # learned on first use
+boilerplate_lock = threading.Lock()
+batch_predictor = None  # created on first use
+
+
+def load_remaining_jobs(batch_size=10):
+    """Load remaining jobs from the warehouse"""
+    return warehouse.remaining_jobs(batch_size).to_dict(orient="records")
+
+
+def save_jobs(df, table_id):
+    """Save jobs to the warehouse"""
+    warehouse.append(table_id, df)
+    logging.info(f"Saved {len(df)} jobs to {table_id}")
+
+
+def delete_jobs_from_raw(job_ids):
+    """Delete jobs from raw_data.jobs"""
+    warehouse.delete_jobs(source_table_id, job_ids)
+    logging.info(f"Deleted {len(job_ids)} jobs from {source_table_id}")
+
+
+def record_usage(response):
+    """Count the tokens a response used; returns the total, or None if it does not say."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        metrics.gemini_tokens.inc(usage.prompt_token_count, kind="prompt")
+        metrics.gemini_tokens.inc(usage.candidates_token_count, kind="output")
+        return usage.prompt_token_count + usage.candidates_token_count
+
+
+def estimate_tokens(text, instruction=system_instruction, outputs=1):
+    # About four characters per token, plus the JSON the model writes back
+    return (len(instruction) + len(text)) // 4 + output_token_estimate * outputs
+
+
+def get_model(batched=False):
+    """The shared model for single descriptions, or for batches of them."""
+    with model_lock:
+        if batched not in models:
+            models[batched] = genai.GenerativeModel(
+                model_name,
+                generation_config={"response_mime_type": "application/json"},
+                system_instruction=batch_system_instruction if batched else system_instruction,
+            )
+        return models[batched]
+
+
+def get_batch_predictor():
+    global batch_predictor
+    if batch_predictor is None:
+        if batch_prediction == "local":
+            batch_predictor = LocalBatchPredictor(
+                batch_prediction_uri,
+                lambda instruction: genai.GenerativeModel(
+                    model_name,
+                    generation_config={"response_mime_type": "application/json"},
+                    system_instruction=instruction,
+                ),
             )
-            response = model.generate_content(job["description"])
-            new_fields = json.loads(response.text)
-            job.update(new_fields)
+        else:
+            batch_predictor = VertexBatchPredictor(
+                batch_prediction_model, batch_prediction_uri, batch_prediction_project, batch_prediction_location
+            )
+    return batch_predictor
+
+
+def load_boilerplate_index():
+    """Index the sentences of the newest descriptions, each distinct description once."""
+    corpus = warehouse.description_corpus(boilerplate_corpus_jobs)
+
+    # Terms extracted from at least a few jobs are never stripped
+    terms = Counter()
+    for column in ["tech_stack", "programming_languages"]:
+        for value in corpus[column].dropna():
+            terms.update(set(value))
+    index = BoilerplateIndex(
+        min_jobs=boilerplate_min_jobs,
+        min_company_jobs=boilerplate_min_company_jobs,
+        protected_terms=[term for term, count in terms.items() if count >= 3],
+    )
+
+    seen = set()
+    for company, description_hash, description in zip(corpus["company"], corpus["description_hash"], corpus["description"]):
+        key = description_hash or description
+        if key not in seen:
+            seen.add(key)
+            index.add(company, description)
+    logging.info(f"Indexed boilerplate in {len(seen)} descriptions")
+    return index
+
+
+def get_boilerplate_index():
+    global boilerplate_index
+    with boilerplate_lock:
+        if boilerplate_index is None:
+            boilerplate_index = load_boilerplate_index()
+        return boilerplate_index
+
+
+def strip_boilerplate(jobs):
+    """Set each job's prompt text to its description without boilerplate; returns the tokens saved."""
+    if not boilerplate_corpus_jobs:
+        return 0
+    index = get_boilerplate_index()
+    saved = 0
+    for job in jobs:
+        job["_prompt"] = index.strip(job.get("company"), job["description"])
+        saved += (len(job["description"]) - len(job["_prompt"])) // 4
+    metrics.boilerplate_tokens_saved.inc(saved)
+    return saved
+
+
+def prompt_text(job):
+    return job.get("_prompt", job["description"])
+
+
+def generate(contents, tokens, batched=False):
+    """generate_content within the rate budget, retrying transient errors with backoff."""
+    for retry in range(max_retries + 1):
+        reserved = budget.acquire(tokens)
+        used = reserved
+        try:
+            with metrics.gemini_request_seconds.time():
+                response = get_model(batched).generate_content(contents)
+            used = record_usage(response) or reserved
+            metrics.gemini_requests.inc(outcome="ok")
+            return response
+        except transient_errors as e:
+            if retry == max_retries:
+                metrics.gemini_requests.inc(outcome="error")
+                raise
+            delay = retry_backoff * 2**retry * random.uniform(0.5, 1.5)
+            if isinstance(e, rate_limit_errors):
+                # Every worker would hit the same quota, so all of them wait
+                metrics.rate_limited.inc(stage="extract")
+                budget.pause(delay)
+            metrics.gemini_requests.inc(outcome="retry")
+            logging.warning(f"Gemini error, retrying in {delay:.1f} seconds ({retry + 1}/{max_retries}) - {e}")
+            time.sleep(delay)
+        except Exception:
+            metrics.gemini_requests.inc(outcome="error")
+            raise
+        finally:
+            budget.settle(reserved, used)
+
+
+def validate_fields(fields):
+    """The extracted fields if they match the schema, else ValueError."""
+    if not isinstance(fields, dict):
+        raise ValueError(f"expected an object, got {type(fields).__name__}")
+    if not isinstance(fields.get("summary"), str) or not fields["summary"].strip():
+        raise ValueError("summary is missing")
+    for name in ["soft_skills", "hard_skills", "tech_stack", "benefits"]:
+        if not isinstance(fields.get(name), list) or not all(isinstance(item, str) for item in fields[name]):
+            raise ValueError(f"{name} is not a list of strings")
+    for name in ["industries", "programming_languages"]:
+        fields.setdefault(name, [])
+        if not isinstance(fields[name], list):
+            raise ValueError(f"{name} is not a list")
+        fields[name] = [str(item) for item in fields[name]]
+    salary = fields.get("salary")
+    if not isinstance(salary, dict) or not all(
+        salary.get(bound) is None or isinstance(salary[bound], (int, float)) for bound in ["min", "max"]
+    ):
+        raise ValueError("salary is not an object with numeric min and max")
+    education = fields.setdefault("education", {})
+    if not isinstance(education, dict):
+        raise ValueError("education is not an object")
+
+    # Shaped like the table's struct columns, which have exactly these fields
+    fields["salary"] = {bound: None if salary.get(bound) is None else float(salary[bound]) for bound in ["min", "max"]}
+    degree = education.get("min_degree")
+    fields["education"] = {
+        "min_degree": None if degree is None else str(degree),
+        "fields": [str(field) for field in education.get("fields") or []],
+    }
+    fields.pop("job_id", None)
+    return fields
+
+
+def extract_job(job):
+    """Extract one job with the single-description prompt; raises if it fails."""
+    text = prompt_text(job)
+    response = generate(text, estimate_tokens(text))
+    job.update(validate_fields(json.loads(response.text)))
+
+
+def group_contents(jobs):
+    """The batched prompt: a JSON array of the jobs' ids and descriptions."""
+    return json.dumps([{"job_id": job["job_id"], "description": prompt_text(job)} for job in jobs])
+
+
+def apply_group_response(jobs, text):
+    """Update jobs from a batched response; returns (job, None) pairs for them and the jobs it had no valid item for."""
+    items = json.loads(text)
+    if not isinstance(items, list):
+        raise ValueError("response is not a JSON array")
+    by_job_id = {str(item.get("job_id")): item for item in items if isinstance(item, dict)}
+
+    results = []
+    remaining = []
+    for job in jobs:
+        try:
+            job.update(validate_fields(by_job_id[str(job["job_id"])]))
+            results.append((job, None))
+        except (KeyError, ValueError):
+            remaining.append(job)
+    return results, remaining
+
+
+def extract_group(jobs):
+    """Extract jobs with one request; returns (job, error) pairs, error None for the good ones.
+
+    When the request fails, or leaves out or mangles some items, the jobs
+    without a valid result are split in half and retried, down to single
+    jobs, which use the single-description prompt. So only jobs that fail
+    on their own end up with an error.
+    """
+    if len(jobs) == 1:
+        try:
+            extract_job(jobs[0])
+            return [(jobs[0], None)]
+        except Exception as e:
+            return [(jobs[0], e)]
+
+    results = []
+    remaining = jobs
+    try:
+        contents = group_contents(jobs)
+        response = generate(
+            contents, estimate_tokens(contents, batch_system_instruction, outputs=len(jobs)), batched=True
+        )
+        results, remaining = apply_group_response(jobs, response.text)
+    except Exception as e:
+        logging.warning(f"Batch of {len(jobs)} jobs failed, splitting - {e}")
+
+    if remaining:
+        metrics.gemini_requests.inc(outcome="split")
+        middle = len(remaining) // 2
+        for half in [remaining[:middle], remaining[middle:]]:
+            if half:
+                results += extract_group(half)
+    return results
+
+
+def pack(jobs):
+    """Group jobs for batched requests, up to batch_jobs jobs and batch_tokens description tokens each."""
+    groups = []
+    group = []
+    group_tokens = 0
+    for job in jobs:
+        tokens = len(prompt_text(job)) // 4
+        if group and (len(group) >= batch_jobs or group_tokens + tokens > batch_tokens):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        group.append(job)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def extract_online(jobs):
+    """Extract the jobs with concurrent requests; yields (job, error) pairs as they finish."""
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(extract_group, group) for group in pack(jobs)]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def extract_batch_prediction(jobs):
+    """Extract the jobs with one batch prediction job; yields (job, error) pairs once it is done.
+
+    The jobs are packed into batched prompts like online requests, one per
+    line of the request file. Jobs whose line failed or whose item is
+    missing or malformed are extracted online instead, and so are all of
+    them if the prediction job cannot be submitted, fails, or is cancelled
+    after batch_prediction_max_wait_seconds.
+    """
+    jobs_by_id = {str(job["job_id"]): job for job in jobs}
+    groups = pack(jobs)
+    answered = set()
+    remaining = []
+    with tempfile.TemporaryDirectory() as directory:
+        requests_path = os.path.join(directory, "requests.jsonl")
+        write_requests(requests_path, [group_contents(group) for group in groups], batch_system_instruction)
+        try:
+            predictor = get_batch_predictor()
+            name = predictor.submit(requests_path)
+            logging.info(f"Submitted batch prediction {name} - {len(jobs)} jobs in {len(groups)} requests")
+            state = wait_for_prediction(predictor, name)
+            prediction_paths = predictor.predictions(name, directory) if state == "succeeded" else []
+        except Exception as e:
+            logging.error(f"Batch prediction of {len(jobs)} jobs failed - {e}")
+            prediction_paths = []
+
+        if prediction_paths:
+            for contents, text, error, usage in read_predictions(prediction_paths):
+                group = [jobs_by_id[str(posting["job_id"])] for posting in json.loads(contents)]
+                answered.update(str(job["job_id"]) for job in group)
+                metrics.gemini_tokens.inc(usage.get("promptTokenCount", 0), kind="prompt")
+                metrics.gemini_tokens.inc(usage.get("candidatesTokenCount", 0), kind="output")
+                try:
+                    if error:
+                        raise RuntimeError(error)
+                    results, missing = apply_group_response(group, text)
+                    for job, _ in results:
+                        job["_version"] = batch_prompt_version
+                    metrics.batch_prediction_requests.inc(outcome="ok")
+                except Exception as e:
+                    logging.warning(f"Batch prediction line for {len(group)} jobs failed - {e}")
+                    metrics.batch_prediction_requests.inc(outcome="error")
+                    results, missing = [], group
+                yield from results
+                remaining += missing
+
+    remaining += [job for job_id, job in jobs_by_id.items() if job_id not in answered]
+    if remaining:
+        logging.warning(f"{len(remaining)} jobs were not extracted by batch prediction, sending them online")
+        yield from extract_online(remaining)
+
+
+def wait_for_prediction(predictor, name):
+    """Poll a prediction job until it ends; returns its state, or "cancelled" once it ran too long."""
+    start_time = time.time()
+    while (state := predictor.state(name)) == "running":
+        if time.time() - start_time >= batch_prediction_max_wait_seconds:
+            logging.warning(
+                f"Batch prediction {name} still running after {batch_prediction_max_wait_seconds:.0f} seconds, "
+                "cancelling it"
+            )
+            try:
+                predictor.cancel(name)
+            except Exception as e:
+                logging.error(f"Failed to cancel batch prediction {name}: {e}")
+            return "cancelled"
+        time.sleep(batch_prediction_poll_seconds)
+    logging.info(f"Batch prediction {name} {state} - elapsed: {time.time() - start_time:.2f}")
+    return state
+
+
+def cache_key(job, version=prompt_version):
+    fingerprint = description_fingerprint(job["description"])
+    return f"{version}-{fingerprint}" if fingerprint else None
+
+
+def get_cached(jobs_by_key):
+    """key -> cached fields for the keys found under either the online or the batch model's version."""
+    batch_keys = {cache_key(same_jobs[0], batch_prompt_version): key for key, same_jobs in jobs_by_key.items()}
+    found = cache.get_many(list(jobs_by_key) + list(batch_keys))
+    cached = {key: found[batch_key] for batch_key, key in batch_keys.items() if batch_key in found}
+    cached.update((key, found[key]) for key in jobs_by_key if key in found)
+    return cached
+
+
+def extract_job_description(jobs, extract=extract_online):
+    """Extract the jobs with extract; a job that still fails after retries goes to raw_data.bad_jobs.
+
+    Jobs whose description is in the cache get the cached fields. Of the
+    rest, jobs with the same description are sent once and share the result.
+    Returns the extracted jobs and the bad jobs.
+    """
+    start_time = time.time()
+    count_done = 0
+    count_errors = 0
+    updated_jobs = []
+    bad_jobs = []
+
+    def finish(job, error=None):
+        nonlocal count_done, count_errors
+        saved = (len(job["description"]) - len(job.pop("_prompt", job["description"]))) // 4
+        if error is None:
             job["created_on"] = time.time()
             updated_jobs.append(job)
             count_done += 1
-
-            elapsed = time.time() - start_time
             logging.info(
-                f"job {job['job_id']} updated - elapsed: {elapsed:.2f} - progress: {count_done+count_errors}/{len(jobs)}"
+                f"job {job['job_id']} updated - elapsed: {time.time() - start_time:.2f} - boilerplate tokens saved: {saved} - progress: {count_done+count_errors}/{len(jobs)}"
             )
-
-        except Exception as e:
+        else:
             count_errors += 1
-            logging.error(f"job {job['job_id']} - total errors: {count_errors} - {e}")
-            job["error"] = str(e)
+            logging.error(f"job {job['job_id']} - total errors: {count_errors} - {error}")
+            job["error"] = str(error)
             bad_jobs.append(job)
 
+    jobs_by_key = {}
+    to_extract = []
+    for job in jobs:
+        key = cache_key(job)
+        if key is None:
+            to_extract.append(job)
+        else:
+            jobs_by_key.setdefault(key, []).append(job)
+
+    cached = get_cached(jobs_by_key) if cache else {}
+    for key, same_jobs in jobs_by_key.items():
+        if key in cached:
+            metrics.extraction_cache.inc(len(same_jobs), result="hit")
+            for job in same_jobs:
+                job.update(validate_fields(dict(cached[key])))
+                finish(job)
+        else:
+            metrics.extraction_cache.inc(len(same_jobs), result="miss")
+            to_extract.append(same_jobs[0])
+    if cached:
+        logging.info(f"{count_done} jobs taken from the extraction cache")
+
+    saved = strip_boilerplate(to_extract)
+    if to_extract:
+        logging.info(
+            f"Stripped boilerplate from {len(to_extract)} descriptions - {saved} tokens saved, "
+            f"{saved / len(to_extract):.0f} per job"
+        )
+
+    for job, error in extract(to_extract) if to_extract else []:
+        key = cache_key(job)
+        version = job.pop("_version", prompt_version)
+        fields = {name: job[name] for name in extraction_fields} if error is None else None
+        if fields and cache and key:
+            cache.put(cache_key(job, version), version, fields)
+        finish(job, error)
+        for same_job in jobs_by_key.get(key, [job])[1:]:
+            if fields:
+                same_job.update(fields)
+            finish(same_job, error)
+
     if updated_jobs:
-        updated_jobs_df = convert_all_columns(pd.DataFrame(updated_jobs))
-        save_jobs(updated_jobs_df, destination_table_id)
+        save_jobs(pd.DataFrame(updated_jobs), destination_table_id)
 
     if bad_jobs:
         bad_jobs_df = pd.DataFrame(bad_jobs)
         save_jobs(bad_jobs_df, bad_jobs_table_id)
         delete_jobs_from_raw([job["job_id"] for job in bad_jobs])
 
+    return updated_jobs, bad_jobs
+
+
+def migrate_extracted_columns():
+    """Move rows that still store the extracted lists and objects as strings to native columns, once."""
+    migrated = warehouse.migrate_nested_columns()
+    if migrated:
+        logging.info(f"Migrated {migrated} rows of {destination_table_id} to array and struct columns")
+
 
 def clean(jobs):
     # Remove newlines, tabs, carriage returns
@@ -181,22 +669,56 @@ def clean(jobs):
     return jobs
 
 
-if __name__ == "__main__":
-    batch_size = 100
+def run_batch_prediction():
+    """Extract the remaining jobs by batch prediction, batch_prediction_max_jobs per prediction job.
+
+    Stops at a scan's last few jobs when they are fewer than
+    batch_prediction_min_jobs, which run() then extracts online.
+    """
+    for df in warehouse.iter_remaining_jobs(batch_prediction_max_jobs):
+        if len(df) < batch_prediction_min_jobs:
+            logging.info(f"{len(df)} remaining jobs are too few for batch prediction, extracting them online")
+            return
+        logging.info(f"Extracting {len(df)} remaining jobs by batch prediction...")
+        extract_job_description(clean(df.to_dict(orient="records")), extract=extract_batch_prediction)
+
+
+def run(batch_size=100):
+    """Extract every remaining job in the warehouse, batch_size jobs at a time.
+
+    Each pass reads the remaining jobs with one scan; another pass picks up
+    anything written while it ran, until a scan finds nothing.
+    """
+    migrate_extracted_columns()
+    warehouse.ensure_description_hash_columns()
+    if cache:
+        purged = cache.purge([prompt_version, batch_prompt_version])
+        if purged:
+            logging.info(f"Purged {purged} cached extractions from an older prompt or model")
+    if batch_prediction:
+        run_batch_prediction()
 
     while True:
-        jobs = load_remaining_jobs(batch_size=batch_size)
-        if not jobs:
-            break
-        jobs = clean(jobs)
+        count = 0
+        for df in warehouse.iter_remaining_jobs(batch_size):
+            jobs = clean(df.to_dict(orient="records"))
 
-        if not all(job.get("description") for job in jobs):
-            logging.error("Some jobs have missing descriptions. Exiting...")
-            sys.exit("Restart the pipeline to scrape job descriptions first.")
+            if not all(job.get("description") for job in jobs):
+                logging.error("Some jobs have missing descriptions. Exiting...")
+                sys.exit("Restart the pipeline to scrape job descriptions first.")
 
-        else:
-            logging.info(f"Processing batch of {len(jobs)} remaining jobs...")
-            extract_job_description(jobs)
-            logging.info(f"Processed batch of {len(jobs)} jobs")
+            else:
+                logging.info(f"Processing batch of {len(jobs)} remaining jobs...")
+                extract_job_description(jobs)
+                count += len(jobs)
+                logging.info(f"Processed batch of {len(jobs)} jobs - {count} this pass")
+
+        if not count:
+            break
 
     logging.info("All remaining jobs processed")
+
+
+if __name__ == "__main__":
+    metrics.start_exporter()
+    run()
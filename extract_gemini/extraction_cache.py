@@ -0,0 +1,57 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class ExtractionCache:
+    """SQLite store of Gemini's extracted fields, keyed by description and prompt.
+
+    Keys are built by the caller from the normalized description hash and a
+    version of the prompt and model, so a new prompt never reads results
+    made with an old one; those rows are only removed by purge().
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+              key TEXT PRIMARY KEY,
+              version TEXT NOT NULL,
+              fields TEXT NOT NULL,
+              created_on REAL NOT NULL
+            )
+            """
+        )
+
+    def get_many(self, keys):
+        """key -> fields for every key in the cache."""
+        keys = list(keys)
+        found = {}
+        with self.lock:
+            # SQLite allows at most 999 parameters per statement in older builds
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, fields FROM extractions WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((key, json.loads(fields)) for key, fields in rows)
+        return found
+
+    def put(self, key, version, fields):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO extractions (key, version, fields, created_on) VALUES (?, ?, ?, ?)",
+                (key, version, json.dumps(fields), time.time()),
+            )
+
+    def purge(self, versions):
+        """Delete entries made with any prompt or model version not in versions; returns how many."""
+        versions = list(versions)
+        with self.lock:
+            return self.connection.execute(
+                f"DELETE FROM extractions WHERE version NOT IN ({', '.join('?' * len(versions))})", versions
+            ).rowcount
@@ -0,0 +1,194 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+# The stages are plain scripts that import their own modules by name, so
+# each stage directory goes on the path, after the repository root for common/
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stage_dirs = [
+    "collect_job_listings",
+    "clean_duplicate_ids",
+    "enrich_job_listings",
+    "clean_duplicate_descriptions",
+    "extract_gemini",
+    "aggregate_dashboard",
+]
+sys.path[:0] = [root] + [os.path.join(root, stage_dir) for stage_dir in stage_dirs]
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+import aggregate_dashboard
+import clean_duplicate_descriptions as dedup
+import clean_duplicate_ids
+import collect_job_listings as collect
+import enrich_job_listings as enrich
+import extract_gemini as extract
+from common import metrics
+from common.warehouse import extracted_jobs, get_warehouse, raw_jobs
+from journal import EnrichmentJournal
+from stages import Stage
+
+# Each stage has its own workers; collection uses COLLECT_CONCURRENCY and
+# enrichment is further limited by its adaptive limiter. Every queue between
+# two stages holds at most queue_size jobs.
+queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+enrich_workers = int(os.getenv("PIPELINE_ENRICH_WORKERS", str(enrich.max_concurrency)))
+extract_workers = int(os.getenv("PIPELINE_EXTRACT_WORKERS", "2"))
+extract_batch_size = int(os.getenv("PIPELINE_EXTRACT_BATCH_SIZE", "100"))
+extract_batch_seconds = float(os.getenv("PIPELINE_EXTRACT_BATCH_SECONDS", "60"))
+
+warehouse = get_warehouse()
+
+
+def run():
+    """Collect, enrich, deduplicate and extract as one stream.
+
+    Every batch of new jobs the collector writes goes straight to the
+    enrichment workers, every enriched description to an exact-duplicate
+    filter, and every new description to the extraction workers, so all four
+    stages run at once. Jobs left over from earlier runs are enriched as
+    well, and extracted by the catch-up pass at the end, which then runs the
+    usual table-level cleanup (duplicate ids, description dedup) around it
+    and rebuilds the dashboard's aggregate tables.
+    """
+    start_time = time.time()
+
+    journal = EnrichmentJournal(enrich.journal_path)
+    journal.compact()
+    # The stream appends native lists and structs, so older string columns are migrated first
+    extract.migrate_extracted_columns()
+    # Streamed rows carry description_hash into extracted_data.jobs and raw_data.bad_jobs
+    warehouse.ensure_description_hash_columns()
+    # Descriptions that were already extracted are never sent to Gemini again
+    extracted_hashes = set(warehouse.description_hashes(extracted_jobs))
+    # Read before collection starts, so new jobs are not queued twice
+    backlog = warehouse.jobs_without_description()
+    logging.info(f"Starting pipeline - {len(backlog)} jobs waiting for a description")
+    # Jobs the dedup stage drops; their raw rows are deleted once the stream is done
+    duplicate_ids = []
+    # Hashes sent to extraction and not finished yet, and the jobs with the
+    # same hash held back until then. A held job is dropped once its hash is
+    # extracted; if that fails it stays in raw_data.jobs for the catch-up pass.
+    queued_hashes = set()
+    held_ids = {}
+    hashes_lock = threading.Lock()
+
+    # Update-only: the stream extracts jobs and deletes them from raw_data.jobs
+    # before their staged descriptions are merged, and an insert would bring
+    # them back as raw rows to extract again. Every job the stream enriches
+    # was already in raw_data.jobs.
+    with enrich.create_writer(journal.mark_merged, insert_missing=False) as writer:
+        replayed = journal.pending()
+        if replayed:
+            logging.info(f"Replaying {len(replayed)} journaled job descriptions")
+        for result in replayed:
+            writer.add(result)
+        replayed_ids = {result["job_id"] for result in replayed}
+
+        def enrich_batch(rows):
+            for row in rows:
+                if row["job_id"] in replayed_ids:
+                    continue
+                result = enrich.job_detail_request(row["job_id"])
+                journal.record(result)
+                writer.add(result)
+                # Backlog rows carry only a job_id; the catch-up pass extracts them
+                if result["description"] and "title" in row:
+                    yield {**row, **result}
+
+        def deduplicate_batch(rows):
+            for row in rows:
+                description_hash = row["description_hash"]
+                with hashes_lock:
+                    if description_hash in extracted_hashes:
+                        duplicate_ids.append(row["job_id"])
+                        continue
+                    if description_hash in queued_hashes:
+                        held_ids.setdefault(description_hash, []).append(row["job_id"])
+                        continue
+                    queued_hashes.add(description_hash)
+                yield row
+
+        def extract_batch(rows):
+            extracted, failed = extract.extract_job_description(extract.clean(rows))
+            with hashes_lock:
+                for job in extracted:
+                    extracted_hashes.add(job["description_hash"])
+                    queued_hashes.discard(job["description_hash"])
+                    duplicate_ids.extend(held_ids.pop(job["description_hash"], []))
+                for job in failed:
+                    # The next job with this description is sent to extraction again
+                    queued_hashes.discard(job["description_hash"])
+                    held = held_ids.pop(job["description_hash"], [])
+                    if held:
+                        logging.info(f"{len(held)} jobs sharing a failed description are left for the catch-up pass")
+            return ()
+
+        extract_stage = Stage(
+            "extract", extract_batch, workers=extract_workers, queue_size=queue_size,
+            batch_size=extract_batch_size, batch_seconds=extract_batch_seconds,
+        )
+        dedup_stage = Stage("dedup", deduplicate_batch, workers=1, queue_size=queue_size, downstream=extract_stage)
+        enrich_stage = Stage(
+            "enrich", enrich_batch, workers=enrich_workers, queue_size=queue_size, downstream=dedup_stage
+        )
+        for stage in [extract_stage, dedup_stage, enrich_stage]:
+            stage.start()
+
+        stopping = threading.Event()
+
+        def feed_backlog():
+            for job_id in backlog:
+                if stopping.is_set():
+                    return
+                enrich_stage.put({"job_id": job_id})
+
+        feeder = threading.Thread(target=feed_backlog, name="backlog", daemon=True)
+        feeder.start()
+
+        def forward(rows):
+            for row in rows:
+                enrich_stage.put(row)
+
+        try:
+            collect.crawl(collect.keywords, collect.locations, on_flush=forward)
+            feeder.join()
+        finally:
+            # Also when the crawl fails or the pod is stopped, so no worker is still
+            # writing when the writer flushes; the rest of the backlog is left for next time
+            stopping.set()
+            # Close in order, so each stage has seen everything upstream before it stops
+            enrich_stage.close()
+            dedup_stage.close()
+            extract_stage.close()
+
+    logging.info(f"Stream finished - elapsed: {time.time() - start_time:.2f}")
+
+    # As clean_duplicate_descriptions does, so the catch-up pass does not extract them again
+    if duplicate_ids:
+        deleted = warehouse.delete_jobs(raw_jobs, duplicate_ids)
+        logging.info(f"Deleted {deleted} raw jobs whose description was already extracted")
+
+    # Catch-up: the same cleanup the stage-by-stage chain ran, for whatever the stream did not cover
+    if clean_duplicate_ids.check_for_duplicates():
+        clean_duplicate_ids.clean_duplicate_ids()
+    dedup.run()
+    extract.run()
+    dedup.run()
+    aggregate_dashboard.run()
+
+    logging.info(f"Pipeline finished - elapsed: {time.time() - start_time:.2f}")
+
+
+if __name__ == "__main__":
+    # Turn a pod shutdown into SystemExit so the staged writer gets its final flush
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    metrics.start_exporter()
+    run()
@@ -0,0 +1,102 @@
+import logging
+import queue
+import threading
+import time
+
+from common import metrics
+
+_DONE = object()
+
+
+class Stage:
+    """A pool of worker threads that reads from a bounded inbox.
+
+    Each worker takes up to batch_size items (waiting at most batch_seconds
+    for a batch to fill), passes them to process and puts whatever process
+    yields on the downstream stage's inbox. put() blocks while the inbox is
+    full, and so does a worker whose downstream inbox is full, so a slow
+    stage holds back the stages before it instead of the queues growing.
+    A batch that raises is logged and counted, and the stage carries on.
+    """
+
+    def __init__(self, name, process, workers=1, queue_size=1000, batch_size=1, batch_seconds=0.0,
+                 downstream=None):
+        self.name = name
+        self.process = process
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.downstream = downstream
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.start_time = None
+        self.threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True) for i in range(workers)
+        ]
+
+    def start(self):
+        self.start_time = time.monotonic()
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item):
+        self.inbox.put(item)
+        metrics.queue_depth.set(self.inbox.qsize(), queue=self.name)
+
+    def close(self):
+        """Wait until every queued item is processed and the workers exit."""
+        for _ in self.threads:
+            self.inbox.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        elapsed = time.monotonic() - self.start_time
+        logging.info(
+            f"Stage {self.name} finished - processed: {self.processed} - passed on: {self.emitted} "
+            f"- errors: {self.errors} - elapsed: {elapsed:.2f}"
+        )
+
+    def _next_batch(self):
+        """(batch, done); done is set once this worker has taken its stop marker."""
+        item = self.inbox.get()
+        metrics.queue_depth.set(self.inbox.qsize(), queue=self.name)
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_seconds
+        while len(batch) < self.batch_size:
+            try:
+                item = self.inbox.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        done = False
+        while not done:
+            batch, done = self._next_batch()
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch):
+        emitted = 0
+        errors = 0
+        try:
+            for result in self.process(batch):
+                if self.downstream:
+                    self.downstream.put(result)
+                emitted += 1
+        except Exception as e:
+            errors = len(batch)
+            logging.error(f"Stage {self.name} failed on a batch of {len(batch)} - {e}")
+        metrics.stage_items.inc(len(batch) - errors, stage=self.name, outcome="processed")
+        metrics.stage_items.inc(emitted, stage=self.name, outcome="passed_on")
+        metrics.stage_items.inc(errors, stage=self.name, outcome="error")
+        with self.lock:
+            self.processed += len(batch)
+            self.emitted += emitted
+            self.errors += errors
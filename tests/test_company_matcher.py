@@ -0,0 +1,30 @@
+import json
+
+from common.company_matcher import BlacklistMatcher, blacklist_version, load_blacklist, normalize_company
+
+
+def test_ambiguous_suffixes_only_dropped_when_written_as_suffix():
+    assert normalize_company("Data Co") == "data co"
+    assert normalize_company("Data Co.") == "data"
+    assert normalize_company("Data, Co") == "data"
+    assert normalize_company("Siemens AG") == "siemens ag"
+    assert normalize_company("Acme S.A.") == "acme"
+    assert normalize_company("Robert Half, Inc.") == "robert half"
+
+
+def test_matcher_normalizes_raw_names():
+    matcher = BlacklistMatcher(["Data Co."])
+    assert "DATA, CO" in matcher
+    assert "Data Co" not in matcher
+
+
+def test_corrupt_cache_falls_back_to_fetch_and_is_rewritten(tmp_path):
+    cache_path = tmp_path / "blacklist.json"
+    cache_path.write_text('{"version": "abc", "compan')
+
+    matcher = load_blacklist(lambda: ["Acme Inc"], str(cache_path), max_age=3600)
+
+    assert "acme" in matcher
+    cached = json.loads(cache_path.read_text())
+    assert cached["version"] == blacklist_version(cached["companies"])
+    assert list(tmp_path.iterdir()) == [cache_path]
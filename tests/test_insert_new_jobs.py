@@ -0,0 +1,86 @@
+import sys
+import types
+
+import pandas as pd
+
+from common import metrics
+from common.warehouse import BigQueryWarehouse, DuckDBWarehouse, raw_jobs
+
+
+def raw_job(job_id, title):
+    return {"job_id": job_id, "title": title, "company": "Acme", "keyword": "python", "created_on": 1.0}
+
+
+def timings(backend):
+    """operation -> number of timed warehouse calls for a backend."""
+    with metrics.warehouse_seconds.lock:
+        return {
+            dict(labels)["operation"]: count
+            for labels, (_, _, count) in metrics.warehouse_seconds.values.items()
+            if dict(labels)["backend"] == backend
+        }
+
+
+def rows_written(name):
+    with metrics.warehouse_rows_written.lock:
+        return metrics.warehouse_rows_written.values.get((("table", name),), 0)
+
+
+def test_duckdb_insert_new_jobs_skips_known_job_ids_and_dedups_the_batch(tmp_path):
+    warehouse = DuckDBWarehouse(str(tmp_path))
+    assert warehouse.insert_new_jobs(pd.DataFrame([raw_job(1, "first")])) == 1
+
+    written = rows_written(raw_jobs)
+    before = timings("duckdb")
+    batch = pd.DataFrame([raw_job(1, "again"), raw_job(2, "old"), raw_job(2, "new")])
+    assert warehouse.insert_new_jobs(batch) == 1
+
+    rows = DuckDBWarehouse(str(tmp_path)).query(f"SELECT job_id, title FROM {raw_jobs} ORDER BY job_id")
+    assert rows.values.tolist() == [[1, "first"], [2, "new"]]
+    assert rows_written(raw_jobs) - written == 2
+    after = timings("duckdb")
+    assert after["insert"] - before.get("insert", 0) == 1
+    assert after.get("dml", 0) == before.get("dml", 0)
+
+
+class FakeQueryJob:
+    num_dml_affected_rows = 2
+
+    def result(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.queries = []
+        self.deleted = []
+
+    def query(self, sql):
+        self.queries.append(sql)
+        return FakeQueryJob()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        self.deleted.append(table_id)
+
+
+def test_bigquery_insert_new_jobs_merges_staged_rows_and_times_once(monkeypatch):
+    loaded = []
+    pandas_gbq = types.ModuleType("pandas_gbq")
+    pandas_gbq.to_gbq = lambda df, table_id, project_id, **kwargs: loaded.append((table_id, df))
+    monkeypatch.setitem(sys.modules, "pandas_gbq", pandas_gbq)
+
+    warehouse = BigQueryWarehouse.__new__(BigQueryWarehouse)
+    warehouse.project_id, warehouse.credentials, warehouse.client = "project", None, FakeClient()
+
+    before = timings("bigquery")
+    batch = pd.DataFrame([raw_job(1, "old"), raw_job(1, "new"), raw_job(2, "other")])
+    assert warehouse.insert_new_jobs(batch) == 2
+
+    (staging_table_id, staged), = loaded
+    assert staged["title"].tolist() == ["new", "other"]
+    (merge_query,) = warehouse.client.queries
+    assert "WHEN NOT MATCHED THEN" in merge_query and "WHEN MATCHED" not in merge_query
+    assert warehouse.client.deleted == [f"project.{staging_table_id}"]
+    after = timings("bigquery")
+    assert after["insert"] - before.get("insert", 0) == 1
+    assert after.get("dml", 0) == before.get("dml", 0)
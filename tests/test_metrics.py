@@ -0,0 +1,22 @@
+from common import metrics
+
+
+def test_render_mixes_int_and_str_label_values():
+    counter = metrics.Counter("test_requests_total", "Requests by status")
+    histogram = metrics.Histogram("test_request_seconds", "Request latency by status", buckets=(1,))
+    try:
+        counter.inc(status=200)
+        counter.inc(status="error")
+        counter.inc(status=200)
+        histogram.observe(0.5, status=429)
+        histogram.observe(2, status="error")
+
+        text = metrics.render()
+    finally:
+        metrics.registry.remove(counter)
+        metrics.registry.remove(histogram)
+
+    assert 'test_requests_total{status="200"} 2' in text
+    assert 'test_requests_total{status="error"} 1' in text
+    assert 'test_request_seconds_count{status="429"} 1' in text
+    assert 'test_request_seconds_bucket{status="error",le="1"} 0' in text
@@ -0,0 +1,77 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "collect_job_listings"))
+
+from pagination import PaginationController  # noqa: E402
+
+
+def test_empty_page_stops():
+    pager = PaginationController()
+    pager.page_fetched(card_count=10, new_count=10)
+    pager.page_fetched(card_count=0, new_count=0)
+
+    assert pager.done
+    assert pager.stop_reason == "empty page"
+
+
+def test_short_page_continues():
+    pager = PaginationController()
+    pager.page_fetched(card_count=10, new_count=10)
+    pager.page_fetched(card_count=7, new_count=7)
+
+    assert not pager.done
+    assert pager.start == 20
+    pager.page_fetched(card_count=10, new_count=10)
+    assert not pager.done
+
+
+def test_saturated_search_stops():
+    pager = PaginationController(saturation_pages=3)
+    pager.page_fetched(card_count=10, new_count=10)
+    pager.page_fetched(card_count=10, new_count=0)
+    pager.page_fetched(card_count=10, new_count=0)
+    assert not pager.done
+
+    pager.page_fetched(card_count=10, new_count=0)
+    assert pager.stop_reason == "no new jobs in 3 pages"
+
+
+def test_new_job_resets_saturation():
+    pager = PaginationController(saturation_pages=2)
+    pager.page_fetched(card_count=10, new_count=0)
+    pager.page_fetched(card_count=10, new_count=1)
+    pager.page_fetched(card_count=10, new_count=0)
+
+    assert not pager.done
+
+
+def test_max_offset_stops():
+    pager = PaginationController(max_offset=30)
+    pager.page_fetched(card_count=10, new_count=10)
+    pager.page_fetched(card_count=10, new_count=10)
+    assert not pager.done
+
+    pager.page_fetched(card_count=10, new_count=10)
+    assert pager.stop_reason == "max offset"
+    assert pager.start == 30
+
+
+def test_retries_back_off_then_stop():
+    pager = PaginationController(max_retries=3, retry_delay=1.0)
+
+    assert [pager.page_failed(500) for _ in range(3)] == [1.0, 2.0, 4.0]
+    assert not pager.done
+    assert pager.start == 0
+
+    assert pager.page_failed("Timeout") == 0
+    assert pager.stop_reason == "status Timeout after 3 retries"
+
+
+def test_fetched_page_resets_retries():
+    pager = PaginationController(max_retries=1, retry_delay=1.0)
+    pager.page_failed(429)
+    pager.page_fetched(card_count=10, new_count=10)
+
+    assert pager.page_failed(429) == 1.0
+    assert not pager.done
@@ -0,0 +1,67 @@
+import os
+import sys
+import threading
+
+import pandas as pd
+
+from common.warehouse import DuckDBWarehouse, raw_jobs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "enrich_job_listings"))
+
+from staged_writer import StagedMergeWriter  # noqa: E402
+
+
+class RecordingWarehouse:
+    """Wraps a warehouse to record which thread ran each merge and how."""
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self.merges = []
+        self.merged = threading.Event()
+
+    def merge_descriptions(self, paths, insert_missing=True):
+        self.warehouse.merge_descriptions(paths, insert_missing=insert_missing)
+        self.merges.append((threading.current_thread().name, insert_missing, len(paths)))
+        self.merged.set()
+
+
+def description(job_id):
+    return {"job_id": job_id, "description": "Python", "created_on": 2.0, "url": "u", "location": "Remote"}
+
+
+def raw_warehouse(tmp_path, job_ids):
+    warehouse = DuckDBWarehouse(str(tmp_path / "warehouse"))
+    warehouse.insert_new_jobs(pd.DataFrame([{"job_id": job_id, "created_on": 1.0} for job_id in job_ids]))
+    return warehouse
+
+
+def test_merges_in_the_background(tmp_path):
+    warehouse = RecordingWarehouse(raw_warehouse(tmp_path, [1, 2, 3]))
+    with StagedMergeWriter(warehouse, stage_dir=str(tmp_path / "staged"), chunk_rows=1, max_rows=2) as writer:
+        for job_id in [1, 2]:
+            writer.add(description(job_id))
+        assert warehouse.merged.wait(5)
+        writer.add(description(3))
+
+    assert warehouse.merges[0][0] == "staged-merge"
+    assert warehouse.warehouse.count(raw_jobs) == 3
+    assert warehouse.warehouse.query(f"SELECT COUNT(*) AS n FROM {raw_jobs} WHERE description = 'Python'")["n"][0] == 3
+    assert not os.listdir(tmp_path / "staged")
+
+
+def test_update_only_leftovers_are_not_merged_with_inserts(tmp_path):
+    warehouse = raw_warehouse(tmp_path, [1])
+    stage_dir = str(tmp_path / "staged")
+    # An update-only writer that is never closed, like one in a crashed run, leaves its files behind
+    update_only = StagedMergeWriter(warehouse, stage_dir=stage_dir, chunk_rows=1, insert_missing=False)
+    for job_id in [1, 2]:
+        update_only.add(description(job_id))
+
+    recording = RecordingWarehouse(warehouse)
+    with StagedMergeWriter(recording, stage_dir=stage_dir):
+        pass
+
+    assert recording.merges[0][1:] == (False, 2)
+    rows = warehouse.query(f"SELECT job_id, description FROM {raw_jobs} ORDER BY job_id")
+    assert rows["job_id"].tolist() == [1]
+    assert rows["description"].tolist() == ["Python"]
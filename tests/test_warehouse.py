@@ -0,0 +1,122 @@
+import pandas as pd
+
+from common.warehouse import DuckDBWarehouse, bad_jobs, extracted_jobs, raw_jobs
+
+
+def write_old_bad_jobs(root):
+    """raw_data/bad_jobs.parquet as written before description_hash existed."""
+    (root / "raw_data").mkdir(parents=True)
+    old = pd.DataFrame([{"job_id": 1, "company": "Acme", "description": "old", "created_on": 1.0, "error": "x"}])
+    old.to_parquet(root / "raw_data" / "bad_jobs.parquet")
+
+
+def bad_job(job_id):
+    return {
+        "job_id": job_id, "company": "Acme", "description": "Python", "description_hash": "abc",
+        "created_on": 2.0, "error": "invalid JSON",
+    }
+
+
+def test_migrated_bad_jobs_accepts_failed_jobs_and_their_raw_rows_are_removed(tmp_path):
+    write_old_bad_jobs(tmp_path)
+    warehouse = DuckDBWarehouse(str(tmp_path))
+    warehouse.insert_new_jobs(pd.DataFrame([
+        {"job_id": job_id, "description": "Python", "description_hash": "abc", "created_on": 2.0}
+        for job_id in [2, 3]
+    ]))
+
+    # What extraction does with a job that keeps failing: move it from raw_data.jobs to bad_jobs
+    warehouse.ensure_description_hash_columns()
+    warehouse.append(bad_jobs, pd.DataFrame([bad_job(2)]))
+    assert warehouse.delete_jobs(raw_jobs, [2]) == 1
+
+    reloaded = DuckDBWarehouse(str(tmp_path))
+    assert reloaded.query(f"SELECT job_id FROM {bad_jobs} ORDER BY job_id")["job_id"].tolist() == [1, 2]
+    assert reloaded.query(f"SELECT job_id FROM {raw_jobs}")["job_id"].tolist() == [3]
+    assert reloaded.remaining_jobs(10)["job_id"].tolist() == [3]
+
+
+def test_ensure_description_hash_columns_adds_it_to_bad_jobs(tmp_path):
+    write_old_bad_jobs(tmp_path)
+    warehouse = DuckDBWarehouse(str(tmp_path))
+
+    warehouse.ensure_description_hash_columns()
+    warehouse.append(bad_jobs, pd.DataFrame([bad_job(2)]))
+
+    reloaded = DuckDBWarehouse(str(tmp_path))
+    rows = reloaded.query(f"SELECT job_id, description_hash FROM {bad_jobs} ORDER BY job_id")
+    assert rows["job_id"].tolist() == [1, 2]
+    assert rows["description_hash"].isna().tolist() == [True, False]
+    for name in [raw_jobs, extracted_jobs, bad_jobs]:
+        assert "description_hash" in reloaded.column_types(name)
+
+
+def test_backfill_description_hashes_adds_it_to_bad_jobs(tmp_path):
+    write_old_bad_jobs(tmp_path)
+    warehouse = DuckDBWarehouse(str(tmp_path))
+
+    warehouse.backfill_description_hashes()
+
+    assert "description_hash" in warehouse.column_types(bad_jobs)
+
+
+def staged_descriptions(path, job_ids):
+    pd.DataFrame(
+        [{"job_id": job_id, "description": "Python", "description_hash": "abc", "created_on": 2.0,
+          "url": "https://example.com", "location": "Remote"} for job_id in job_ids]
+    ).to_parquet(path)
+    return [str(path)]
+
+
+def test_merge_descriptions_inserts_missing_jobs_by_default(tmp_path):
+    warehouse = DuckDBWarehouse(str(tmp_path))
+    warehouse.insert_new_jobs(pd.DataFrame([{"job_id": 1, "created_on": 1.0}]))
+
+    warehouse.merge_descriptions(staged_descriptions(tmp_path / "staged.parquet", [1, 2]))
+
+    rows = warehouse.query(f"SELECT job_id, description FROM {raw_jobs} ORDER BY job_id")
+    assert rows["job_id"].tolist() == [1, 2]
+    assert rows["description"].tolist() == ["Python", "Python"]
+
+
+def test_merge_descriptions_update_only_keeps_deleted_jobs_deleted(tmp_path):
+    warehouse = DuckDBWarehouse(str(tmp_path))
+    warehouse.insert_new_jobs(pd.DataFrame([{"job_id": 1, "created_on": 1.0}, {"job_id": 2, "created_on": 1.0}]))
+    warehouse.delete_jobs(raw_jobs, [2])
+
+    warehouse.merge_descriptions(staged_descriptions(tmp_path / "staged.parquet", [1, 2]), insert_missing=False)
+
+    rows = warehouse.query(f"SELECT job_id, description FROM {raw_jobs} ORDER BY job_id")
+    assert rows["job_id"].tolist() == [1]
+    assert rows["description"].tolist() == ["Python"]
+
+
+def extracted_row(job_id, created_on, description_hash):
+    return {"job_id": job_id, "created_on": created_on, "description": "Python", "description_hash": description_hash}
+
+
+def test_deduplicate_incremental_keeps_a_job_whose_rows_share_created_on(tmp_path):
+    warehouse = DuckDBWarehouse(str(tmp_path))
+    warehouse.append(extracted_jobs, pd.DataFrame([
+        extracted_row(1, 5.0, "a"),
+        extracted_row(1, 5.0, "a"),  # the same job written twice at once
+        extracted_row(1, 3.0, "a"),
+        extracted_row(2, 4.0, "b"),
+    ]))
+
+    _, extracted_removed, _ = warehouse.deduplicate_incremental(raw_since=0.0, extracted_since=0.0)
+
+    rows = warehouse.query(f"SELECT job_id, created_on FROM {extracted_jobs} ORDER BY job_id, created_on")
+    assert rows.values.tolist() == [[1, 5.0], [2, 4.0]]
+    assert extracted_removed == 2
+    assert warehouse.query("SELECT * FROM information_schema.tables WHERE table_name LIKE '%restore%'").empty
+
+
+def test_deduplicate_incremental_drops_older_descriptions(tmp_path):
+    warehouse = DuckDBWarehouse(str(tmp_path))
+    warehouse.append(extracted_jobs, pd.DataFrame([extracted_row(1, 5.0, "a"), extracted_row(2, 5.0, "a"),
+                                                   extracted_row(3, 6.0, "a")]))
+
+    warehouse.deduplicate_incremental(raw_since=0.0, extracted_since=0.0)
+
+    assert warehouse.query(f"SELECT job_id FROM {extracted_jobs}")["job_id"].tolist() == [3]